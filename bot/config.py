@@ -5,14 +5,21 @@ TGmusicbot - 配置模块
 """
 
 import os
+import re
+import base64
+import queue
+import atexit
 import logging
+import threading
+import logging.handlers
 from pathlib import Path
-from datetime import datetime
-from cryptography.fernet import Fernet
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
-# 加载环境变量
-load_dotenv()
+# 加载环境变量（进程内只解析一次 .env，重复导入/热重载时跳过）
+if not os.environ.get('_TGMUSICBOT_DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['_TGMUSICBOT_DOTENV_LOADED'] = '1'
 
 # --- 应用信息 ---
 APP_NAME = "TGmusicbot"
@@ -26,14 +33,22 @@ DATA_DIR = Path(os.environ.get('DATA_DIR', SCRIPT_DIR / 'data'))
 UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/tmp/tgmusicbot_uploads'))
 MUSIC_TARGET_DIR = Path(os.environ.get('MUSIC_TARGET_DIR', SCRIPT_DIR / 'uploads'))
 
-# 确保目录存在
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-MUSIC_TARGET_DIR.mkdir(parents=True, exist_ok=True)
+
+def ensure_dirs():
+    """确保数据/上传/音乐目录存在（已存在时只做一次 stat）"""
+    for d in (DATA_DIR, UPLOAD_DIR, MUSIC_TARGET_DIR):
+        path = str(d)
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+
+
+# 日志文件位于 DATA_DIR，必须在 setup_logging 之前确保目录存在
+ensure_dirs()
 
 DATABASE_FILE = (DATA_DIR / 'bot.db').resolve()
 LIBRARY_CACHE_FILE = DATA_DIR / 'library_cache.json'
-LOG_FILE = DATA_DIR / f'bot_{datetime.now().strftime("%Y%m%d")}.log'
+# 独立于 bot 进程的 bot.log（main.py 自行轮转），避免两个进程轮转同一文件互相删除归档
+LOG_FILE = DATA_DIR / 'web.log'  # 按天轮转，历史文件为 web.log.YYYYMMDD.log
 
 # --- Telegram 配置 ---
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN') or os.environ.get('TELEGRAM_TOKEN')
@@ -44,13 +59,53 @@ ADMIN_USER_ID = os.environ.get('ADMIN_USER_ID')
 TG_API_ID = os.environ.get('TG_API_ID', '')
 TG_API_HASH = os.environ.get('TG_API_HASH', '')
 
+# --- 开关/数值型环境变量（由下方各配置段引用） ---
+def _env_bool(key: str, default: bool = False) -> bool:
+    value = os.environ.get(key)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_int(key: str, default: int) -> int:
+    value = os.environ.get(key)
+    return default if value is None else int(value)
+
+
+@dataclass(frozen=True, slots=True)
+class _Config:
+    """布尔/整数型开关，启动时从环境变量解析一次"""
+    emby_webhook_notify: bool
+    make_playlist_public: bool
+    auto_download: bool
+    emby_scan_interval: int
+    default_playlist_sync_interval_minutes: int
+    min_playlist_sync_interval_minutes: int
+    playlist_sync_poll_interval_seconds: int
+    playlist_sync_initial_delay_seconds: int
+
+
+CONFIG = _Config(
+    emby_webhook_notify=_env_bool('EMBY_WEBHOOK_NOTIFY', True),
+    make_playlist_public=_env_bool('MAKE_PLAYLIST_PUBLIC'),
+    auto_download=_env_bool('AUTO_DOWNLOAD'),
+    emby_scan_interval=_env_int('EMBY_SCAN_INTERVAL', 0),
+    default_playlist_sync_interval_minutes=max(
+        1,
+        _env_int('PLAYLIST_SYNC_INTERVAL', _env_int('PLAYLIST_SYNC_INTERVAL_MINUTES', 360))
+    ),
+    min_playlist_sync_interval_minutes=max(1, _env_int('PLAYLIST_SYNC_MIN_INTERVAL', 1)),
+    playlist_sync_poll_interval_seconds=max(30, _env_int('PLAYLIST_SYNC_POLL_INTERVAL', 60)),
+    playlist_sync_initial_delay_seconds=max(0, _env_int('PLAYLIST_SYNC_INITIAL_DELAY', 10)),
+)
+
 # --- Emby 配置 ---
 EMBY_URL = os.environ.get('EMBY_URL')
 EMBY_USERNAME = os.environ.get('EMBY_USERNAME')
 EMBY_PASSWORD = os.environ.get('EMBY_PASSWORD')
-EMBY_WEBHOOK_NOTIFY = os.environ.get('EMBY_WEBHOOK_NOTIFY', 'true').lower() == 'true'
-MAKE_PLAYLIST_PUBLIC = os.environ.get('MAKE_PLAYLIST_PUBLIC', 'false').lower() == 'true'
-EMBY_SCAN_INTERVAL = int(os.environ.get('EMBY_SCAN_INTERVAL', '0'))
+EMBY_WEBHOOK_NOTIFY = CONFIG.emby_webhook_notify
+MAKE_PLAYLIST_PUBLIC = CONFIG.make_playlist_public
+EMBY_SCAN_INTERVAL = CONFIG.emby_scan_interval
 
 # Emby API 参数
 EMBY_SCAN_PAGE_SIZE = 2000
@@ -60,7 +115,7 @@ EMBY_PLAYLIST_ADD_BATCH_SIZE = 20
 NCM_COOKIE = os.environ.get('NCM_COOKIE', '')
 QQ_COOKIE = os.environ.get('QQ_COOKIE', '')
 NCM_QUALITY = os.environ.get('NCM_QUALITY', 'exhigh')  # standard/higher/exhigh/lossless/hires
-AUTO_DOWNLOAD = os.environ.get('AUTO_DOWNLOAD', 'false').lower() == 'true'
+AUTO_DOWNLOAD = CONFIG.auto_download
 
 # Daily Ranking Config
 DAILY_RANKING_TITLE = os.environ.get('DAILY_RANKING_TITLE', '每日音乐热曲榜')
@@ -79,10 +134,27 @@ ALLOWED_AUDIO_EXTENSIONS = (
 # --- 加密配置 ---
 ENCRYPTION_KEY = os.environ.get('PLAYLIST_BOT_KEY')
 if not ENCRYPTION_KEY:
-    ENCRYPTION_KEY = Fernet.generate_key().decode()
+    # 与 Fernet.generate_key() 等价，避免导入时加载 cryptography
+    ENCRYPTION_KEY = base64.urlsafe_b64encode(os.urandom(32)).decode()
     print(f"警告：未设置 PLAYLIST_BOT_KEY，已生成新密钥：{ENCRYPTION_KEY}")
 
-fernet = Fernet(ENCRYPTION_KEY.encode())
+_fernet = None
+
+
+def get_fernet():
+    """获取 Fernet 实例（首次使用时才导入 cryptography）"""
+    global _fernet
+    if _fernet is None:
+        from cryptography.fernet import Fernet
+        _fernet = Fernet(ENCRYPTION_KEY.encode())
+    return _fernet
+
+
+def __getattr__(name):
+    # 兼容 `from bot.config import fernet`
+    if name == 'fernet':
+        return get_fernet()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- API 端点 ---
 QQ_API_GET_PLAYLIST_URL = "http://i.y.qq.com/qzone/fcg-bin/fcg_ucc_getcdinfo_byids_cp.fcg"
@@ -93,14 +165,10 @@ NCM_API_SONG_DETAIL_URL = "https://music.163.com/api/song/detail/"
 MATCH_THRESHOLD = 9
 
 # --- 歌单同步调度配置 ---
-DEFAULT_PLAYLIST_SYNC_INTERVAL_MINUTES = max(
-    1,
-    int(os.environ.get('PLAYLIST_SYNC_INTERVAL', 
-        os.environ.get('PLAYLIST_SYNC_INTERVAL_MINUTES', '360')))
-)
-MIN_PLAYLIST_SYNC_INTERVAL_MINUTES = max(1, int(os.environ.get('PLAYLIST_SYNC_MIN_INTERVAL', '1')))
-PLAYLIST_SYNC_POLL_INTERVAL_SECONDS = max(30, int(os.environ.get('PLAYLIST_SYNC_POLL_INTERVAL', '60')))
-PLAYLIST_SYNC_INITIAL_DELAY_SECONDS = max(0, int(os.environ.get('PLAYLIST_SYNC_INITIAL_DELAY', '10')))
+DEFAULT_PLAYLIST_SYNC_INTERVAL_MINUTES = CONFIG.default_playlist_sync_interval_minutes
+MIN_PLAYLIST_SYNC_INTERVAL_MINUTES = CONFIG.min_playlist_sync_interval_minutes
+PLAYLIST_SYNC_POLL_INTERVAL_SECONDS = CONFIG.playlist_sync_poll_interval_seconds
+PLAYLIST_SYNC_INITIAL_DELAY_SECONDS = CONFIG.playlist_sync_initial_delay_seconds
 
 # --- 搜索缓存配置 ---
 SEARCH_CACHE_TTL = 180  # 3分钟
@@ -109,17 +177,79 @@ SEARCH_CACHE_TTL = 180  # 3分钟
 WEB_USERNAME = os.environ.get('WEB_USERNAME', 'admin')
 WEB_PASSWORD = os.environ.get('WEB_PASSWORD', '')
 
+# --- 日志配置 ---
+LOG_BUFFER_CAPACITY = 1000  # 缓冲条数上限
+LOG_FLUSH_INTERVAL = 1.0  # 秒
+LOG_BACKUP_COUNT = 30  # 保留最近 30 天日志
+
 
 def setup_logging():
-    """配置日志"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(LOG_FILE, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
+    """配置日志
+
+    根 logger 只挂一个 QueueHandler，调用方只做内存入队；
+    真正的文件/控制台写入由后台 QueueListener 线程完成。
+    文件写入再经 MemoryHandler 缓冲：满 LOG_BUFFER_CAPACITY 条、
+    遇到 ERROR 或每 LOG_FLUSH_INTERVAL 秒才落盘一次。
+
+    约定：调用时传 %s 参数而不是 f-string，例如
+    logger.debug("结果: %s", value)，级别未开启时不做任何格式化。
+
+    若根 logger 已配置过 handler（如 bot 进程中 main.py 先完成了日志设置，
+    之后才懒加载本模块），直接复用，不再启动队列/刷新线程。
+    """
+    if logging.getLogger().handlers:
+        return logging.getLogger('TGmusicbot')
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler = logging.handlers.TimedRotatingFileHandler(
+        LOG_FILE,
+        when='midnight',
+        interval=1,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8',
+        delay=True
+    )
+    file_handler.suffix = '%Y%m%d.log'
+    # suffix 改了必须同步 extMatch，否则 backupCount 清理匹配不到任何历史文件
+    # （3.11+ 按 '.' 分段逐段匹配，旧版本匹配整个 '20260101.log'，两种都要覆盖）
+    file_handler.extMatch = re.compile(r'^\d{8}(\.log)?$')
+    file_handler.setFormatter(formatter)
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=LOG_BUFFER_CAPACITY,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True
+    )
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 入队前只渲染 message，完整格式由下游 handler 负责，避免前缀重复
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+
+    listener = logging.handlers.QueueListener(
+        log_queue, buffered_file_handler, stream_handler, respect_handler_level=True
     )
-    return logging.getLogger('TGmusicbot')
+    listener.start()
+
+    # 定时刷新缓冲，避免低流量时日志长时间滞留在内存
+    stop_flush = threading.Event()
+
+    def _flush_loop():
+        while not stop_flush.wait(LOG_FLUSH_INTERVAL):
+            buffered_file_handler.flush()
+
+    threading.Thread(target=_flush_loop, name='log-flush', daemon=True).start()
+
+    # 进程退出时先停止监听线程（写完队列），再关闭缓冲（写完剩余日志）
+    atexit.register(buffered_file_handler.close)
+    atexit.register(stop_flush.set)
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger('TGmusicbot')
+    logger._listener = listener
+    return logger
 
 logger = setup_logging()
@@ -13,6 +13,8 @@ import html
 import sqlite3
 import asyncio
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 from typing import List, Dict, Optional, Any, Union
 import datetime as dt
 from datetime import datetime, timedelta
@@ -23,7 +25,7 @@ from cryptography.fernet import Fernet
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process as fuzz_process
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, BotCommand
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, InlineQueryHandler
 from telegram.error import NetworkError, Forbidden, ChatMigrated
@@ -50,7 +52,6 @@ MUSIC_TARGET_DIR.mkdir(parents=True, exist_ok=True)
 
 DATABASE_FILE = (DATA_DIR / 'bot.db').resolve()
 LIBRARY_CACHE_FILE = DATA_DIR / 'library_cache.json'
-LOG_FILE = DATA_DIR / f'bot_{datetime.now().strftime("%Y%m%d")}.log'
 
 # 环境变量配置
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN') or os.environ.get('TELEGRAM_TOKEN')
@@ -61,15 +62,10 @@ EMBY_URL = os.environ.get('EMBY_URL')
 EMBY_USERNAME = os.environ.get('EMBY_USERNAME')
 EMBY_PASSWORD = os.environ.get('EMBY_PASSWORD')
 
-# Emby Webhook 通知开关
-EMBY_WEBHOOK_NOTIFY = os.environ.get('EMBY_WEBHOOK_NOTIFY', 'true').lower() == 'true'
-MAKE_PLAYLIST_PUBLIC = os.environ.get('MAKE_PLAYLIST_PUBLIC', 'false').lower() == 'true'
-
 # 网易云/QQ音乐下载配置
 NCM_COOKIE = os.environ.get('NCM_COOKIE', '')  # 网易云登录 Cookie
 QQ_COOKIE = os.environ.get('QQ_COOKIE', '')  # QQ音乐登录 Cookie
 NCM_QUALITY = os.environ.get('NCM_QUALITY', 'exhigh')  # 下载音质: standard/higher/exhigh/lossless/hires
-AUTO_DOWNLOAD = os.environ.get('AUTO_DOWNLOAD', 'false').lower() == 'true'  # 是否自动下载缺失歌曲
 
 # 国内代理服务配置（用于海外 VPS 下载 QQ/网易云音乐）
 MUSIC_PROXY_URL = os.environ.get('MUSIC_PROXY_URL', '')  # 如 http://国内IP:8899
@@ -81,6 +77,7 @@ EMBY_SCAN_INTERVAL = int(os.environ.get('EMBY_SCAN_INTERVAL', '0'))
 # Pyrogram 配置（大文件上传支持，可选）
 TG_API_ID = os.environ.get('TG_API_ID', '')
 TG_API_HASH = os.environ.get('TG_API_HASH', '')
+TG_MAX_TRANSMISSIONS = int(os.environ.get('TG_MAX_TRANSMISSIONS', 4))  # Pyrogram 同时进行的文件传输数
 
 # 允许上传的音频格式
 ALLOWED_AUDIO_EXTENSIONS = ('.mp3', '.flac', '.m4a', '.wav', '.ogg', '.aac', '.ape', '.wma', '.alac', '.aiff', '.dsd', '.dsf', '.dff')
@@ -105,7 +102,7 @@ def get_ncm_cookie():
                 pass
         
         # 如果全局连接没好，尝试直接开一个临时的
-        temp_conn = sqlite3.connect(str(DATA_DIR / 'bot.db'), timeout=10)
+        temp_conn = connect_database(timeout=10)
         temp_conn.row_factory = sqlite3.Row
         cursor = temp_conn.cursor()
         cursor.execute('SELECT value FROM bot_settings WHERE key = ?', ('ncm_cookie',))
@@ -134,7 +131,7 @@ def get_qq_cookie():
                 pass
         
         # 临时的独立连接
-        temp_conn = sqlite3.connect(str(DATA_DIR / 'bot.db'), timeout=10)
+        temp_conn = connect_database(timeout=10)
         temp_conn.row_factory = sqlite3.Row
         cursor = temp_conn.cursor()
         cursor.execute('SELECT value FROM bot_settings WHERE key = ?', ('qq_cookie',))
@@ -149,7 +146,7 @@ def get_qq_cookie():
 
 # 下载管理器（全局实例）
 from bot.download_manager import DownloadManager, init_download_manager as _init_dm, get_download_manager
-from bot.ncm_downloader import NeteaseMusicAPI
+from bot.ncm_downloader import NeteaseMusicAPI, QQMusicAPI, MusicAutoDownloader
 
 download_manager = None
 
@@ -166,10 +163,12 @@ fernet = Fernet(ENCRYPTION_KEY.encode())
 QQ_API_GET_PLAYLIST_URL = "http://i.y.qq.com/qzone/fcg-bin/fcg_ucc_getcdinfo_byids_cp.fcg"
 NCM_API_PLAYLIST_DETAIL_URL = "https://music.163.com/api/v3/playlist/detail"
 NCM_API_SONG_DETAIL_URL = "https://music.163.com/api/song/detail/"
+NCM_DETAIL_FETCH_WORKERS = 4  # 歌曲详情批次并发数
 
 # 匹配参数
 MATCH_THRESHOLD = 9
 EMBY_SCAN_PAGE_SIZE = 2000
+EMBY_SCAN_WORKERS = 4  # 媒体库分页并发数
 EMBY_PLAYLIST_ADD_BATCH_SIZE = 5
 
 # --- 全局状态 ---
@@ -183,6 +182,22 @@ ncm_downloader = None  # 网易云下载器实例
 _cmd_search_cache = {}  # {(platform, keyword): (timestamp, results)}
 _cmd_search_cache_ttl = 180  # 3分钟
 
+# 搜索命令复用的平台 API 客户端（按 Cookie 缓存，保留其 HTTP 会话与连接）
+_music_api_cache = {}  # {(api_cls, cookie, kwargs): api}
+_MUSIC_API_CACHE_MAX = 8
+
+
+def _get_music_api(api_cls, cookie, **kwargs):
+    """获取缓存的 NeteaseMusicAPI/QQMusicAPI 实例，Cookie 变化时自动新建"""
+    key = (api_cls, cookie, tuple(sorted(kwargs.items())))
+    api = _music_api_cache.get(key)
+    if api is None:
+        if len(_music_api_cache) >= _MUSIC_API_CACHE_MAX:
+            _music_api_cache.clear()
+        api = api_cls(cookie, **kwargs)
+        _music_api_cache[key] = api
+    return api
+
 # 歌单同步调度配置
 DEFAULT_PLAYLIST_SYNC_INTERVAL_MINUTES = max(
     1,
@@ -289,6 +304,17 @@ def escape_markdown(text: str) -> str:
     return text
 
 
+def _move_file(src: Path, dst: Path):
+    """移动文件并覆盖已存在的目标（同一文件系统时只需一次 rename）"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        # 跨文件系统：删除旧文件后复制移动
+        if dst.exists():
+            dst.unlink()
+        shutil.move(str(src), str(dst))
+
+
 async def start_pyrogram_client():
     """启动 Pyrogram 客户端用于接收大文件"""
     global pyrogram_client
@@ -298,16 +324,23 @@ async def start_pyrogram_client():
         return
     
     try:
+        import inspect
         from pyrogram import Client, filters as pyro_filters
         from pyrogram.handlers import MessageHandler as PyroMessageHandler
         
+        # 默认只允许 1 个并发传输，多个大文件同时转发时会排队；旧版 Pyrogram 无此参数
+        client_kwargs = {}
+        if 'max_concurrent_transmissions' in inspect.signature(Client).parameters:
+            client_kwargs['max_concurrent_transmissions'] = TG_MAX_TRANSMISSIONS
+        
         # 创建 Pyrogram 客户端（Bot 模式）
         pyrogram_client = Client(
             name="tgmusicbot_pyrogram",
             api_id=int(TG_API_ID),
             api_hash=TG_API_HASH,
             bot_token=TELEGRAM_TOKEN,
-            workdir=str(DATA_DIR)
+            workdir=str(DATA_DIR),
+            **client_kwargs
         )
         
         @pyrogram_client.on_message(pyro_filters.audio | pyro_filters.document)
@@ -346,28 +379,24 @@ async def start_pyrogram_client():
                 
                 # 确保目录存在
                 download_path = Path(download_dir)
-                download_path.mkdir(parents=True, exist_ok=True)
+                await asyncio.to_thread(download_path.mkdir, parents=True, exist_ok=True)
                 
                 # 使用 Pyrogram 下载大文件
                 temp_path = UPLOAD_DIR / original_name
                 await message.download(file_name=str(temp_path))
                 
-                # 清理文件名并移动到下载目录
+                # 清理文件名并移动到下载目录（大文件跨盘移动可能耗时数秒，放到线程中执行）
                 clean_name = clean_filename(original_name)
                 target_path = download_path / clean_name
-                
-                if target_path.exists():
-                    target_path.unlink()
-                
-                shutil.move(str(temp_path), str(target_path))
+                await asyncio.to_thread(_move_file, temp_path, target_path)
                 
                 # 如果是 MusicTag 模式
                 final_path = target_path
                 if download_mode == 'musictag' and musictag_dir:
                     musictag_path = Path(musictag_dir)
-                    musictag_path.mkdir(parents=True, exist_ok=True)
+                    await asyncio.to_thread(musictag_path.mkdir, parents=True, exist_ok=True)
                     final_dest = musictag_path / clean_name
-                    shutil.move(str(target_path), str(final_dest))
+                    await asyncio.to_thread(_move_file, target_path, final_dest)
                     final_path = final_dest
                     logger.info(f"已移动大文件到 MusicTag: {clean_name}")
                 
@@ -384,7 +413,8 @@ async def start_pyrogram_client():
                     if auto_organize and organize_dir:
                         try:
                             from bot.file_organizer import organize_file
-                            organized_path = organize_file(
+                            organized_path = await asyncio.to_thread(
+                                organize_file,
                                 str(final_path), organize_dir, organize_template,
                                 move=True, on_conflict='skip'
                             )
@@ -462,10 +492,30 @@ logging.getLogger('httpcore').setLevel(logging.WARNING)
 logging.getLogger('telegram').setLevel(logging.WARNING)
 logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
+# 开关型配置统一取自 bot.config（接受 1/true/yes/on），与 Web 端保持一致；
+# 须在上方日志初始化之后导入，bot.config 的 setup_logging 才会跳过
+from bot.config import CONFIG
+EMBY_WEBHOOK_NOTIFY = CONFIG.emby_webhook_notify  # Emby Webhook 通知开关
+MAKE_PLAYLIST_PUBLIC = CONFIG.make_playlist_public
+AUTO_DOWNLOAD = CONFIG.auto_download  # 是否自动下载缺失歌曲
+
 # ============================================================
 # 工具函数
 # ============================================================
 
+def admin_only(func):
+    """命令处理器装饰器：非管理员直接回复无权限并返回（管理员 ID 在装饰时解析为整数）"""
+    admin_id = int(ADMIN_USER_ID) if ADMIN_USER_ID and ADMIN_USER_ID.lstrip('-').isdigit() else None
+    
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        if update.effective_user.id != admin_id:
+            await update.message.reply_text("无权执行此命令")
+            return
+        return await func(update, context, *args, **kwargs)
+    
+    return wrapper
+
 def create_requests_session():
     session = requests.Session()
     session.trust_env = False  # 禁用环境变量代理，防止内网 Emby 或依赖走代理报错
@@ -476,8 +526,10 @@ def create_requests_session():
     session.mount("https://", adapter)
     return session
 
+_JSONP_RE = re.compile(r'^[^{]*\(({.*?})\)[^}]*$')
+
 def strip_jsonp(jsonp_str):
-    match = re.match(r'^[^{]*\(({.*?})\)[^}]*$', jsonp_str.strip())
+    match = _JSONP_RE.match(jsonp_str.strip())
     return match.group(1) if match else jsonp_str
 
 def encrypt_password(password):
@@ -491,38 +543,73 @@ def decrypt_password(encrypted_password):
         logger.warning("密码解密失败，可能需要重新绑定账号")
         return encrypted_password
 
-def _normalize_artists(artist_str: str) -> set:
-    if not isinstance(artist_str, str): return set()
+# 匹配循环中的热点正则，模块加载时编译一次
+_ARTIST_PAREN_RE = re.compile(r'\s*[\(（].*?[\)）]')
+_ARTIST_BRACKET_RE = re.compile(r'\s*[\[【].*?[\]】]')
+_ARTIST_FEAT_RE = re.compile(r'\s+(feat|ft|with|vs|presents|pres\.|starring)\.?\s+')
+_ARTIST_AMP_RE = re.compile(r'\s*&\s*')
+_ARTIST_SPLIT_RE = re.compile(r'\s*[/•,、;&|]\s*')
+_TITLE_BRACKET_RE = re.compile(r'\s*[\(（【\[].*?[\)）】\]]')
+
+# 匹配时同一歌手/标题会对每首源歌曲重复出现，结果按字符串缓存
+@lru_cache(maxsize=65536)
+def _normalize_artists_cached(artist_str: str) -> frozenset:
     s = artist_str.lower()
-    s = re.sub(r'\s*[\(（].*?[\)）]', '', s)
-    s = re.sub(r'\s*[\[【].*?[\]】]', '', s)
-    s = re.sub(r'\s+(feat|ft|with|vs|presents|pres\.|starring)\.?\s+', '/', s)
-    s = re.sub(r'\s*&\s*', '/', s)
-    return {artist.strip() for artist in re.split(r'\s*[/•,、;&|]\s*', s) if artist.strip()}
+    s = _ARTIST_PAREN_RE.sub('', s)
+    s = _ARTIST_BRACKET_RE.sub('', s)
+    s = _ARTIST_FEAT_RE.sub('/', s)
+    s = _ARTIST_AMP_RE.sub('/', s)
+    return frozenset(artist.strip() for artist in _ARTIST_SPLIT_RE.split(s) if artist.strip())
+
+def _normalize_artists(artist_str: str) -> frozenset:
+    if not isinstance(artist_str, str): return frozenset()
+    return _normalize_artists_cached(artist_str)
+
+@lru_cache(maxsize=65536)
+def _get_title_lookup_key_cached(title: str) -> str:
+    return _TITLE_BRACKET_RE.sub('', title.lower()).strip()
 
 def _get_title_lookup_key(title: str) -> str:
     if not isinstance(title, str): return ""
-    key = title.lower()
-    key = re.sub(r'\s*[\(（【\[].*?[\)）】\]]', '', key).strip()
-    return key
+    return _get_title_lookup_key_cached(title)
+
+@lru_cache(maxsize=1024)
+def _follow_short_url(url: str) -> str:
+    """跟随短链接跳转，只取最终地址不下载页面正文（出错或未跳转时抛异常，不会被缓存）"""
+    headers = {'User-Agent': 'Mozilla/5.0', 'Accept': 'text/html'}
+    response = requests_session.head(url, headers=headers, timeout=(10, 20), allow_redirects=True)
+    if response.status_code in (405, 501):
+        # 不支持 HEAD 的短链服务回退到 GET（stream 模式下不读取正文）
+        response = requests_session.get(url, headers=headers, timeout=(10, 20), allow_redirects=True, stream=True)
+        response.close()
+    response.raise_for_status()
+    if response.url == url:
+        # 没有发生跳转（限流页、临时故障等），不缓存，下次重新解析
+        raise ValueError(f"短链接未跳转: {url}")
+    return response.url
 
 def _resolve_short_url(url: str) -> str:
     try:
-        headers = {'User-Agent': 'Mozilla/5.0', 'Accept': 'text/html'}
-        response = requests_session.get(url, headers=headers, timeout=(10, 20), allow_redirects=True)
-        if response.url != url:
-            logger.info(f"短链接解析: {url} -> {response.url}")
-        return response.url
+        resolved = _follow_short_url(url)
+        if resolved != url:
+            logger.info(f"短链接解析: {url} -> {resolved}")
+        return resolved
     except:
         return url
 
+# 文件名非法字符删除表（str.translate 单次 C 级遍历）
+_FILENAME_STRIP_TABLE = str.maketrans('', '', '<>:"/\\|?*')
+_FILENAME_TRACKNO_RE = re.compile(r'^\d+\s*[-_. ]+\s*')
+_FILENAME_UNDERSCORE_RE = re.compile(r'[_]+')
+_FILENAME_DUP_SUFFIX_RE = re.compile(r'\s*\(\d+\)\s*')
+
 def clean_filename(name: str) -> str:
     """清理文件名"""
-    name = re.sub(r'^\d+\s*[-_. ]+\s*', '', name)
-    name = re.sub(r'[_]+', ' ', name)
-    name = re.sub(r'\s*\(\d+\)\s*', '', name)
+    name = _FILENAME_TRACKNO_RE.sub('', name)
+    name = _FILENAME_UNDERSCORE_RE.sub(' ', name)
+    name = _FILENAME_DUP_SUFFIX_RE.sub('', name)
     # 移除非法字符
-    name = re.sub(r'[<>:"/\\|?*]', '', name)
+    name = name.translate(_FILENAME_STRIP_TABLE)
     return name.strip()
 
 
@@ -612,7 +699,6 @@ def scan_emby_library(save_to_cache=True, user_id=None, access_token=None):
     global emby_library_data
     logger.info("开始扫描 Emby 媒体库...")
     scanned_songs = []
-    start_index = 0
     
     scan_user_id = user_id or emby_auth['user_id']
     scan_access_token = access_token or emby_auth['access_token']
@@ -621,39 +707,53 @@ def scan_emby_library(save_to_cache=True, user_id=None, access_token=None):
     
     temp_auth = {'user_id': scan_user_id, 'access_token': scan_access_token}
     
-    while True:
+    def fetch_page(start_index):
         params = {
             'IncludeItemTypes': 'Audio', 'Recursive': 'true',
             'Limit': EMBY_SCAN_PAGE_SIZE, 'StartIndex': start_index,
             'Fields': 'Id,Name,ArtistItems,Album,AlbumArtist'  # 添加 Album 字段
         }
-        response = call_emby_api(f"Users/{scan_user_id}/Items", params, user_auth=temp_auth, timeout=(15, 180))
-        
-        if response and 'Items' in response:
-            items = response['Items']
-            if not items: break
-            for item in items:
-                artists = "/".join([a.get('Name', '') for a in item.get('ArtistItems', [])])
-                album = item.get('Album', '') or item.get('AlbumArtist', '')  # 获取专辑名
-                scanned_songs.append({
-                    'id': str(item.get('Id')),
-                    'title': html.unescape(item.get('Name', '')),
-                    'artist': html.unescape(artists),
-                    'album': html.unescape(album) if album else ''  # 保存专辑名
-                })
-            logger.info(f"已扫描 {len(scanned_songs)} 首歌曲...")
-            if len(items) < EMBY_SCAN_PAGE_SIZE: break
-            start_index += EMBY_SCAN_PAGE_SIZE
-        else:
+        return call_emby_api(f"Users/{scan_user_id}/Items", params, user_auth=temp_auth, timeout=(15, 180))
+    
+    def iter_pages():
+        first = fetch_page(0)
+        yield first
+        total = (first or {}).get('TotalRecordCount')
+        if total is None:
+            # 未返回总数时退回逐页拉取
+            start_index, response = 0, first
+            while response and len(response.get('Items') or []) >= EMBY_SCAN_PAGE_SIZE:
+                start_index += EMBY_SCAN_PAGE_SIZE
+                response = fetch_page(start_index)
+                yield response
+            return
+        # 已知总数：其余分页并发拉取，按顺序返回
+        offsets = range(EMBY_SCAN_PAGE_SIZE, total, EMBY_SCAN_PAGE_SIZE)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(len(offsets), EMBY_SCAN_WORKERS)) as pool:
+                yield from pool.map(fetch_page, offsets)
+    
+    for response in iter_pages():
+        if not response or not response.get('Items'):
             break
+        for item in response['Items']:
+            artists = "/".join([a.get('Name', '') for a in item.get('ArtistItems', [])])
+            album = item.get('Album', '') or item.get('AlbumArtist', '')  # 获取专辑名
+            scanned_songs.append({
+                'id': str(item.get('Id')),
+                'title': html.unescape(item.get('Name', '')),
+                'artist': html.unescape(artists),
+                'album': html.unescape(album) if album else ''  # 保存专辑名
+            })
+        logger.info(f"已扫描 {len(scanned_songs)} 首歌曲...")
     
     emby_library_data = scanned_songs
     logger.info(f"扫描完成，共 {len(emby_library_data)} 首歌曲")
     
     if save_to_cache:
         try:
-            with open(LIBRARY_CACHE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(emby_library_data, f, ensure_ascii=False)
+            # json.dumps 走 C 编码器一次性序列化；json.dump 会逐块走纯 Python 编码路径
+            LIBRARY_CACHE_FILE.write_text(json.dumps(emby_library_data, ensure_ascii=False), encoding='utf-8')
         except Exception as e:
             logger.error(f"保存缓存失败: {e}")
     
@@ -676,34 +776,36 @@ def delete_emby_playlist(playlist_id, user_auth):
 # 歌单解析
 # ============================================================
 
+_URL_RE = re.compile(r'https?://\S+')
+_QQ_SHORT_HOST_RE = re.compile(r'(?:c6|c|cx|t|m)\.y\.qq\.com')
+# (平台, [歌单 ID 正则...])，按顺序尝试
+_PLAYLIST_ID_PATTERNS = (
+    # 网易云
+    ("netease", [re.compile(r"music\.163\.com.*[?&/#]id=(\d+)"), re.compile(r"music\.163\.com/playlist/(\d+)")]),
+    # QQ音乐
+    ("qq", [
+        re.compile(r"y\.qq\.com/n/ryqq(?:_v2)?/playlist/(\d+)"),
+        re.compile(r"m\.y\.qq\.com/playsquare/(\d+)"),
+        re.compile(r"(?:y|i|c|m)\.qq\.com/.*?[?&](?:id|dissid)=(\d+)"),
+        re.compile(r"y\.qq\.com/w/taoge\.html\?id=(\d+)"),
+    ]),
+    # Spotify
+    ("spotify", [re.compile(r"open\.spotify\.com/playlist/([a-zA-Z0-9]+)"), re.compile(r"spotify:playlist:([a-zA-Z0-9]+)")]),
+)
+
 def parse_playlist_input(input_str: str):
     input_str = input_str.strip()
-    url_match = re.search(r'https?://\S+', input_str)
+    url_match = _URL_RE.search(input_str)
     url = url_match.group(0) if url_match else input_str
     
-    if '163cn.tv' in url or re.search(r'(?:c6|c|cx|t|m)\.y\.qq\.com', url) or 'y.qq.com/w/' in url:
+    if '163cn.tv' in url or _QQ_SHORT_HOST_RE.search(url) or 'y.qq.com/w/' in url:
         url = _resolve_short_url(url)
     
-    # 网易云
-    for pattern in [r"music\.163\.com.*[?&/#]id=(\d+)", r"music\.163\.com/playlist/(\d+)"]:
-        match = re.search(pattern, url)
-        if match: return "netease", match.group(1)
-    
-    # QQ音乐
-    for pattern in [
-        r"y\.qq\.com/n/ryqq(?:_v2)?/playlist/(\d+)", 
-        r"m\.y\.qq\.com/playsquare/(\d+)",
-        r"(?:y|i|c|m)\.qq\.com/.*?[?&](?:id|dissid)=(\d+)", 
-        r"y\.qq\.com/w/taoge\.html\?id=(\d+)"
-    ]:
-        match = re.search(pattern, url)
-        if match:
-            return "qq", match.group(1)
-    
-    # Spotify
-    for pattern in [r"open\.spotify\.com/playlist/([a-zA-Z0-9]+)", r"spotify:playlist:([a-zA-Z0-9]+)"]:
-        match = re.search(pattern, url)
-        if match: return "spotify", match.group(1)
+    for platform, patterns in _PLAYLIST_ID_PATTERNS:
+        for pattern in patterns:
+            match = pattern.search(url)
+            if match:
+                return platform, match.group(1)
     
     return None, None
 
@@ -793,14 +895,21 @@ def get_ncm_playlist_details(playlist_id):
         headers = {'Referer': 'https://music.163.com/', 'User-Agent': 'Mozilla/5.0'}
         if ncm_cookie: headers['Cookie'] = ncm_cookie
         
-        for i in range(0, len(track_ids), 200):
-            batch_ids = track_ids[i:i + 200]
+        # 尝试用 EAPI 批量获取详情? NeteaseMusicAPI 还没有批量获取详情的方法
+        # 暂时保留旧 API，因为 ids 参数传过去了，一般都能查到 (除了被下架的)
+        def fetch_batch(batch_ids):
+            return requests_session.get(NCM_API_SONG_DETAIL_URL,
+                                        params={'ids': f"[{','.join(batch_ids)}]"},
+                                        headers=headers, timeout=(10, 15))
+        
+        # 各批次并发请求，按原顺序合并结果
+        batches = [track_ids[i:i + 200] for i in range(0, len(track_ids), 200)]
+        with ThreadPoolExecutor(max_workers=max(1, min(len(batches), NCM_DETAIL_FETCH_WORKERS))) as pool:
+            futures = [pool.submit(fetch_batch, batch_ids) for batch_ids in batches]
+        
+        for future in futures:
             try:
-                # 尝试用 EAPI 批量获取详情? NeteaseMusicAPI 还没有批量获取详情的方法
-                # 暂时保留旧 API，因为 ids 参数传过去了，一般都能查到 (除了被下架的)
-                detail_response = requests_session.get(NCM_API_SONG_DETAIL_URL,
-                                                       params={'ids': f"[{','.join(batch_ids)}]"},
-                                                       headers=headers, timeout=(10, 15))
+                detail_response = future.result()
                 if detail_response.status_code == 200:
                     for s in detail_response.json().get('songs', []):
                         song_id = str(s.get('id'))
@@ -949,11 +1058,12 @@ def find_best_match(source_track, candidates, match_mode):
     source_album = source_track.get('album', '').strip()  # 新增专辑匹配
     
     if match_mode == "完全匹配":
-        source_artists_norm = set(_normalize_artists(source_artist))
+        source_artists_norm = _normalize_artists(source_artist)
+        source_title_key = _get_title_lookup_key(source_title)
         for track in candidates:
             # 标题标准化比较 (忽略括号内的后缀，如 "爱你没错 (电视剧...)" == "爱你没错")
-            if _get_title_lookup_key(source_title) == _get_title_lookup_key(track.get('title', '').strip()):
-                track_artists_norm = set(_normalize_artists(track.get('artist', '')))
+            if source_title_key == _get_title_lookup_key(track.get('title', '').strip()):
+                track_artists_norm = _normalize_artists(track.get('artist', ''))
                 
                 # 放宽歌手匹配：允许以下情况匹配
                 # 1. 完全相同
@@ -996,20 +1106,23 @@ def find_best_match(source_track, candidates, match_mode):
     source_album_lower = source_album.lower() if source_album else ''
     source_artists_norm = _normalize_artists(source_artist)
     
-    for track in candidates:
-        track_title_lower = track.get('title', '').lower()
+    # 标题相似度在 rapidfuzz 的 C++ 循环里一次算完（全库后备扫描时候选数可达数万）
+    candidate_titles = [track.get('title', '').lower() for track in candidates]
+    title_sims = [0] * len(candidates)
+    for _, sim, idx in fuzz_process.extract(source_title_lower, candidate_titles, scorer=fuzz.ratio,
+                                            processor=None, limit=None):
+        title_sims[idx] = sim
+    
+    for track, track_title_lower, title_sim in zip(candidates, candidate_titles, title_sims):
         # 模糊匹配逻辑优化
         
         # 1. 标题匹配
-        title_sim = fuzz.ratio(source_title_lower, track_title_lower)
-        title_partial = fuzz.partial_ratio(source_title_lower, track_title_lower)
-        
         title_pts = 0
         if title_sim >= 95: 
             title_pts = 10
         elif title_sim >= 88: 
             title_pts = 8
-        elif title_partial == 100:
+        elif fuzz.partial_ratio(source_title_lower, track_title_lower) == 100:
             # 完整包含关系 (如 "连续剧" vs "连续剧 (剧集...)")
             # 如果是前缀匹配，给予较高分数
             if track_title_lower.startswith(source_title_lower) or source_title_lower.startswith(track_title_lower):
@@ -1133,7 +1246,8 @@ def process_playlist(playlist_url, user_id=None, force_public=False, user_bindin
         match = find_best_match(source_track, emby_index.get(key, []), match_mode)
         
         # 尝试全库扫描作为后备方案（如果在索引桶里没找到）
-        if not match:
+        # 完全匹配要求标题键相同，非空键的候选已全部在索引桶里，全库扫描不会有新结果
+        if not match and not (key and match_mode == "完全匹配"):
              # logger.info(f"索引查找失败，尝试全库扫描: {source_track.get('title')}")
              match = find_best_match(source_track, emby_library_data, match_mode)
 
@@ -1288,9 +1402,27 @@ def process_playlist(playlist_url, user_id=None, force_public=False, user_bindin
 # 数据库操作
 # ============================================================
 
+# 每个连接打开后执行：WAL 让读写互不阻塞，NORMAL 在 WAL 下仅检查点时 fsync
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",  # 256MB 内存映射读，减少读路径的 read() 系统调用
+)
+
+
+def connect_database(**kwargs):
+    """打开 bot.db 连接并应用 SQLITE_PRAGMAS"""
+    conn = sqlite3.connect(str(DATABASE_FILE), **kwargs)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
 def init_database():
     global database_conn
-    database_conn = sqlite3.connect(str(DATABASE_FILE), check_same_thread=False)
+    database_conn = connect_database(check_same_thread=False)
     cursor = database_conn.cursor()
     
     # 用户绑定表
@@ -1595,7 +1727,7 @@ def save_download_record(songs: list, success_files: list, failed_songs: list,
                     p = Path(file_path)
                     if p.exists():
                         file_size = p.stat().st_size
-                        logger.debug(f"获取文件大小成功: {file_size} bytes")
+                        logger.debug("获取文件大小成功: %s bytes", file_size)
                     else:
                         logger.warning(f"保存下载记录时文件不存在: {file_path}")
                 except Exception as e:
@@ -1637,7 +1769,7 @@ def save_download_record(songs: list, success_files: list, failed_songs: list,
             ))
         
         database_conn.commit()
-        logger.debug(f"保存下载记录: {len(success_files)} 成功, {len(failed_songs)} 失败")
+        logger.debug("保存下载记录: %d 成功, %d 失败", len(success_files), len(failed_songs))
     except Exception as e:
         logger.error(f"保存下载记录失败: {e}")
 
@@ -1700,7 +1832,7 @@ def save_download_record_v2(success_results: list, failed_songs: list,
                     p = Path(file_path)
                     if p.exists():
                         file_size = p.stat().st_size
-                        logger.debug(f"获取文件大小成功: {file_size} bytes, 路径: {file_path}")
+                        logger.debug("获取文件大小成功: %s bytes, 路径: %s", file_size, file_path)
                     else:
                         logger.warning(f"保存下载记录时文件不存在（可能已被外部程序移走）: {file_path}")
                 except Exception as e:
@@ -1745,7 +1877,7 @@ def save_download_record_v2(success_results: list, failed_songs: list,
         
         ncm_count = sum(1 for r in success_results if r.get('platform') == 'NCM')
         qq_count = sum(1 for r in success_results if r.get('platform') == 'QQ')
-        logger.debug(f"保存下载记录: NCM {ncm_count} 首, QQ {qq_count} 首, 失败 {len(failed_songs)} 首")
+        logger.debug("保存下载记录: NCM %d 首, QQ %d 首, 失败 %d 首", ncm_count, qq_count, len(failed_songs))
     except Exception as e:
         logger.error(f"保存下载记录失败: {e}")
 
@@ -1769,7 +1901,7 @@ def _parse_db_timestamp(value):
         normalized = value.replace('Z', '+00:00')
         return dt.datetime.fromisoformat(normalized)
     except Exception:
-        logger.debug(f"无法解析时间戳: {value}")
+        logger.debug("无法解析时间戳: %s", value)
         return None
 
 
@@ -1794,11 +1926,11 @@ def get_playlist_sync_interval():
             try:
                 interval = int(raw_value)
                 final_interval = max(MIN_PLAYLIST_SYNC_INTERVAL_MINUTES, interval)
-                logger.debug(f"[SyncInterval] DB值={raw_value}, 使用={final_interval}分钟")
+                logger.debug("[SyncInterval] DB值=%s, 使用=%s分钟", raw_value, final_interval)
                 return final_interval
             except ValueError:
                 logger.warning(f"无效的 playlist_sync_interval 配置: {raw_value}")
-        logger.debug(f"[SyncInterval] 未找到DB配置，使用默认值={default_interval}分钟")
+        logger.debug("[SyncInterval] 未找到DB配置，使用默认值=%s分钟", default_interval)
         return default_interval
     except Exception as e:
         logger.error(f"读取歌单同步间隔失败: {e}")
@@ -1860,7 +1992,7 @@ def get_scheduled_playlists(telegram_id: str = None):
             try:
                 last_song_ids = json.loads(row['last_song_ids']) if row['last_song_ids'] else []
             except Exception:
-                logger.debug(f"无法解析 last_song_ids: {row['last_song_ids']}")
+                logger.debug("无法解析 last_song_ids: %s", row['last_song_ids'])
                 last_song_ids = []
             playlists.append({
                 'id': row['id'],
@@ -1979,7 +2111,7 @@ async def check_playlist_updates(app):
     # Only scan Emby if we have playlists to sync
     if emby_auth:
         try:
-            scan_emby_library(save_to_cache=True)
+            await asyncio.to_thread(scan_emby_library, save_to_cache=True)
             logger.info(f"Emby 库缓存已刷新: {len(emby_library_data)} 首歌曲")
         except Exception as e:
             logger.warning(f"刷新 Emby 库缓存失败: {e}")
@@ -2001,15 +2133,15 @@ async def check_playlist_updates(app):
                 if not playlist_id:
                     logger.warning(f"无法解析网易云歌单链接: {playlist_url}")
                     continue
-                remote_name, songs = get_ncm_playlist_details(playlist_id)
+                remote_name, songs = await asyncio.to_thread(get_ncm_playlist_details, playlist_id)
             elif platform == 'qq':
                 playlist_id = extract_playlist_id(playlist_url, 'qq')
                 if not playlist_id:
                     logger.warning(f"无法解析 QQ 歌单链接: {playlist_url}")
                     continue
-                remote_name, songs = get_qq_playlist_details(playlist_id)
+                remote_name, songs = await asyncio.to_thread(get_qq_playlist_details, playlist_id)
             else:
-                logger.debug(f"暂不支持的平台 {platform}")
+                logger.debug("暂不支持的平台 %s", platform)
                 continue
             if remote_name:
                 playlist_name = remote_name
@@ -2045,7 +2177,7 @@ async def check_playlist_updates(app):
                         except:
                             pass
                 except Exception as cookie_e:
-                    logger.debug(f"Cookie 检查异常: {cookie_e}")
+                    logger.debug("Cookie 检查异常: %s", cookie_e)
                 continue
             logger.info(f"歌单 '{playlist_name}' 共 {len(songs)} 首，旧记录 {len(old_song_ids)} 首")
             current_song_ids = [str(s.get('source_id') or s.get('id') or s.get('title', '')) for s in songs]
@@ -2085,7 +2217,7 @@ async def check_playlist_updates(app):
                 if new_songs and emby_auth:
                     logger.info(f"歌单 '{playlist_name}' 有 {len(new_songs)} 首新歌，自动同步到 Emby...")
                     try:
-                        result, error = process_playlist(playlist['playlist_url'], int(telegram_id), force_public=False, match_mode="模糊匹配", skip_scan=True)
+                        result, error = await asyncio.to_thread(process_playlist, playlist['playlist_url'], int(telegram_id), force_public=False, match_mode="模糊匹配", skip_scan=True)
                         if error:
                             logger.error(f"自动同步歌单 '{playlist_name}' 失败: {error}")
                         else:
@@ -2107,7 +2239,7 @@ async def check_playlist_updates(app):
                 logger.info(f"歌单 '{playlist_name}' 无新歌曲，但仍验证 Emby 同步状态...")
                 if emby_auth:
                     try:
-                        result, error = process_playlist(playlist['playlist_url'], int(telegram_id), force_public=False, match_mode="模糊匹配", skip_scan=True)
+                        result, error = await asyncio.to_thread(process_playlist, playlist['playlist_url'], int(telegram_id), force_public=False, match_mode="模糊匹配", skip_scan=True)
                         if error:
                             logger.warning(f"验证同步歌单 '{playlist_name}' 失败: {error}")
                         else:
@@ -2174,7 +2306,7 @@ def get_ncm_settings():
     """获取网易云下载设置（优先从数据库读取，否则从环境变量）"""
     default_settings = {
         'ncm_quality': os.environ.get('NCM_QUALITY', 'exhigh'),
-        'auto_download': os.environ.get('AUTO_DOWNLOAD', 'false').lower() in ('true', 'on', '1', 'yes'),
+        'auto_download': AUTO_DOWNLOAD,
         'download_mode': 'local',
         'download_dir': str(MUSIC_TARGET_DIR),
         'musictag_dir': '',
@@ -2426,9 +2558,9 @@ async def handle_match_callback(update: Update, context: ContextTypes.DEFAULT_TY
                 song_ids = []
                 # 从原始歌单获取
                 if playlist_type == "netease":
-                    _, songs = get_ncm_playlist_details(extract_playlist_id(playlist_url, 'netease'))
+                    _, songs = await asyncio.to_thread(get_ncm_playlist_details, extract_playlist_id(playlist_url, 'netease'))
                 else:
-                    _, songs = get_qq_playlist_details(extract_playlist_id(playlist_url, 'qq'))
+                    _, songs = await asyncio.to_thread(get_qq_playlist_details, extract_playlist_id(playlist_url, 'qq'))
                 if songs:
                     song_ids = [str(s.get('source_id') or s.get('id') or s.get('title', '')) for s in songs]
                 add_scheduled_playlist(user_id, playlist_url, result['name'], playlist_type, song_ids)
@@ -2624,9 +2756,6 @@ async def handle_download_callback(update: Update, context: ContextTypes.DEFAULT
     await query.edit_message_text(f"🔄 正在下载 {len(ncm_songs)} 首歌曲...\n\n请耐心等待，下载完成后会通知您。")
     
     try:
-        # 动态导入下载模块
-        from bot.ncm_downloader import MusicAutoDownloader
-        
         # 从数据库读取下载设置
         ncm_settings = get_ncm_settings()
         download_quality = ncm_settings.get('ncm_quality', 'exhigh')
@@ -2997,7 +3126,6 @@ async def cmd_ncm_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔄 正在检查网易云登录状态...")
     
     try:
-        from bot.ncm_downloader import NeteaseMusicAPI
         api = NeteaseMusicAPI(ncm_cookie)
         logged_in, info = api.check_login()
         
@@ -3048,13 +3176,14 @@ async def cmd_rescan(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"✅ 扫描完成，共 {len(new_data)} 首歌曲")
 
 
+# 搜索结果键盘中固定不变的「全部下载」行，模块加载时构建一次供各次搜索复用
+_NCM_DL_ALL_ROW = (InlineKeyboardButton("📥 全部下载", callback_data="dl_song_all"),)
+_QQ_DL_ALL_ROW = (InlineKeyboardButton("📥 全部下载", callback_data="qdl_song_all"),)
+
+
+@admin_only
 async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """搜索歌曲"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     if not context.args:
         await update.message.reply_text("用法: /search <关键词>\n例如: /search 周杰伦 晴天")
         return
@@ -3071,14 +3200,13 @@ async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cached = _cmd_search_cache.get(cache_key)
     if cached and time.time() - cached[0] < _cmd_search_cache_ttl:
         results = cached[1]
-        logger.debug(f"使用缓存的搜索结果: {keyword}")
+        logger.debug("使用缓存的搜索结果: %s", keyword)
     else:
         await update.message.reply_text(f"🔍 正在搜索: {keyword}...")
         
         try:
-            from bot.ncm_downloader import NeteaseMusicAPI
-            api = NeteaseMusicAPI(ncm_cookie)
-            results = api.search_song(keyword, limit=10)
+            api = _get_music_api(NeteaseMusicAPI, ncm_cookie)
+            results = await asyncio.to_thread(api.search_song, keyword, limit=10)
             
             # 缓存结果
             _cmd_search_cache[cache_key] = (time.time(), results)
@@ -3115,7 +3243,7 @@ async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton(f"📥 {i+1}. {song['title'][:20]}", callback_data=f"dl_song_{i}")
             ])
         
-        keyboard_buttons.append([InlineKeyboardButton("📥 全部下载", callback_data="dl_song_all")])
+        keyboard_buttons.append(_NCM_DL_ALL_ROW)
         keyboard = InlineKeyboardMarkup(keyboard_buttons)
         
         await update.message.reply_text(msg, parse_mode='MarkdownV2', reply_markup=keyboard)
@@ -3125,13 +3253,9 @@ async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ 搜索失败: {e}")
 
 
+@admin_only
 async def cmd_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """搜索并下载专辑"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     if not context.args:
         await update.message.reply_text("用法: /album <专辑名或关键词>\n例如: /album 范特西")
         return
@@ -3146,9 +3270,8 @@ async def cmd_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"🔍 正在搜索专辑: {keyword}...")
     
     try:
-        from bot.ncm_downloader import NeteaseMusicAPI
-        api = NeteaseMusicAPI(ncm_cookie)
-        results = api.search_album(keyword, limit=5)
+        api = _get_music_api(NeteaseMusicAPI, ncm_cookie)
+        results = await asyncio.to_thread(api.search_album, keyword, limit=5)
         
         if not results:
             await update.message.reply_text("未找到相关专辑")
@@ -3178,13 +3301,9 @@ async def cmd_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ 搜索失败: {e}")
 
 
+@admin_only
 async def cmd_qq_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """QQ音乐搜索歌曲"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     if not context.args:
         await update.message.reply_text("用法: /qs <关键词>\n例如: /qs 周杰伦 晴天")
         return
@@ -3201,14 +3320,13 @@ async def cmd_qq_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cached = _cmd_search_cache.get(cache_key)
     if cached and time.time() - cached[0] < _cmd_search_cache_ttl:
         results = cached[1]
-        logger.debug(f"使用缓存的 QQ 搜索结果: {keyword}")
+        logger.debug("使用缓存的 QQ 搜索结果: %s", keyword)
     else:
         await update.message.reply_text(f"🔍 正在搜索 QQ音乐: {keyword}...")
         
         try:
-            from bot.ncm_downloader import QQMusicAPI
-            api = QQMusicAPI(qq_cookie, proxy_url=MUSIC_PROXY_URL, proxy_key=MUSIC_PROXY_KEY)
-            results = api.search_song(keyword, limit=10)
+            api = _get_music_api(QQMusicAPI, qq_cookie, proxy_url=MUSIC_PROXY_URL, proxy_key=MUSIC_PROXY_KEY)
+            results = await asyncio.to_thread(api.search_song, keyword, limit=10)
             
             # 缓存结果
             _cmd_search_cache[cache_key] = (time.time(), results)
@@ -3238,7 +3356,7 @@ async def cmd_qq_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton(f"📥 {i+1}. {song['title'][:20]}", callback_data=f"qdl_song_{i}")
             ])
         
-        keyboard_buttons.append([InlineKeyboardButton("📥 全部下载", callback_data="qdl_song_all")])
+        keyboard_buttons.append(_QQ_DL_ALL_ROW)
         keyboard = InlineKeyboardMarkup(keyboard_buttons)
         
         await update.message.reply_text(msg, parse_mode='MarkdownV2', reply_markup=keyboard)
@@ -3248,13 +3366,9 @@ async def cmd_qq_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ 搜索失败: {e}")
 
 
+@admin_only
 async def cmd_qq_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """QQ音乐搜索并下载专辑"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     if not context.args:
         await update.message.reply_text("用法: /qz <专辑名或关键词>\n例如: /qz 范特西")
         return
@@ -3269,9 +3383,8 @@ async def cmd_qq_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"🔍 正在搜索 QQ音乐专辑: {keyword}...")
     
     try:
-        from bot.ncm_downloader import QQMusicAPI
-        api = QQMusicAPI(qq_cookie, proxy_url=MUSIC_PROXY_URL, proxy_key=MUSIC_PROXY_KEY)
-        results = api.search_album(keyword, limit=5)
+        api = _get_music_api(QQMusicAPI, qq_cookie, proxy_url=MUSIC_PROXY_URL, proxy_key=MUSIC_PROXY_KEY)
+        results = await asyncio.to_thread(api.search_album, keyword, limit=5)
         
         if not results:
             await update.message.reply_text("未找到相关专辑")
@@ -3305,25 +3418,42 @@ async def cmd_qq_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 下载管理命令
 # ============================================================
 
+# 文件大小单位表，按 bit_length 每 10 位一档: (单位, 除数, 小数位)
+_FILE_SIZE_UNITS = (
+    ('B', 1, 0),
+    ('KB', 1 << 10, 1),
+    ('MB', 1 << 20, 1),
+    ('GB', 1 << 30, 2),
+)
+
+
 def format_file_size(size_bytes: int) -> str:
     """格式化文件大小"""
-    if size_bytes < 1024:
+    rung = min(max((int(size_bytes).bit_length() - 1) // 10, 0), len(_FILE_SIZE_UNITS) - 1)
+    if not rung:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    elif size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
-    else:
-        return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
-
-
+    unit, divisor, digits = _FILE_SIZE_UNITS[rung]
+    return f"{size_bytes / divisor:.{digits}f} {unit}"
+
+
+# 下载队列/历史状态图标
+_QUEUE_STATUS_EMOJI = {
+    'pending': '⏳',
+    'downloading': '📥',
+    'completed': '✅',
+    'failed': '❌',
+    'retrying': '🔄',
+    'cancelled': '🚫'
+}
+_HISTORY_STATUS_EMOJI = {
+    'completed': '✅',
+    'failed': '❌',
+}
+
+
+@admin_only
 async def cmd_download_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """查看下载状态 /ds"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     manager = get_download_manager()
     if not manager:
         await update.message.reply_text("📊 下载管理器未启用\n\n使用传统下载模式")
@@ -3333,38 +3463,37 @@ async def cmd_download_status(update: Update, context: ContextTypes.DEFAULT_TYPE
     queue = stats['queue']
     today = stats['today']
     
-    msg = "📊 **下载状态**\n\n"
-    
-    # 队列状态
-    msg += "**📥 下载队列**\n"
-    msg += f"├ 等待中: {queue['pending']}\n"
-    msg += f"├ 下载中: {queue['downloading']}\n"
-    msg += f"├ 重试中: {queue['retrying']}\n"
-    msg += f"├ 已完成: {queue['completed']}\n"
-    msg += f"└ 失败: {queue['failed']}\n\n"
-    
-    # 今日统计
-    msg += "**📈 今日统计**\n"
-    msg += f"├ 成功: {today['total_success']} 首\n"
-    msg += f"├ 失败: {today['total_fail']} 首\n"
-    msg += f"└ 总大小: {format_file_size(today['total_size'])}\n\n"
+    parts = [
+        "📊 <b>下载状态</b>",
+        "",
+        # 队列状态
+        "<b>📥 下载队列</b>",
+        f"├ 等待中: {queue['pending']}",
+        f"├ 下载中: {queue['downloading']}",
+        f"├ 重试中: {queue['retrying']}",
+        f"├ 已完成: {queue['completed']}",
+        f"└ 失败: {queue['failed']}",
+        "",
+        # 今日统计
+        "<b>📈 今日统计</b>",
+        f"├ 成功: {today['total_success']} 首",
+        f"├ 失败: {today['total_fail']} 首",
+        f"└ 总大小: {format_file_size(today['total_size'])}",
+        "",
+    ]
     
     # 平台分布
     if today['by_platform']:
-        msg += "**🎵 平台分布**\n"
+        parts.append("<b>🎵 平台分布</b>")
         for platform, data in today['by_platform'].items():
-            msg += f"├ {platform}: {data['success']} 成功 / {data['fail']} 失败\n"
+            parts.append(f"├ {html.escape(str(platform), quote=False)}: {data['success']} 成功 / {data['fail']} 失败")
     
-    await update.message.reply_text(msg, parse_mode='Markdown')
+    await update.message.reply_text("\n".join(parts), parse_mode='HTML')
 
 
+@admin_only
 async def cmd_download_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """查看下载队列 /dq"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     manager = get_download_manager()
     if not manager:
         await update.message.reply_text("📭 下载管理器未启用")
@@ -3377,36 +3506,22 @@ async def cmd_download_queue(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("📭 下载队列为空")
         return
     
-    msg = f"📥 **下载队列** ({queue_status['total']} 个任务)\n\n"
+    parts = [f"📥 <b>下载队列</b> ({queue_status['total']} 个任务)", ""]
     
-    status_emoji = {
-        'pending': '⏳',
-        'downloading': '📥',
-        'completed': '✅',
-        'failed': '❌',
-        'retrying': '🔄',
-        'cancelled': '🚫'
-    }
-    
-    for i, task in enumerate(tasks[-10:], 1):
-        emoji = status_emoji.get(task['status'], '❓')
-        name = task.get('title', '未知')[:25]
-        artist = task.get('artist', '')[:15]
-        msg += f"{emoji} `{name}` - {artist}\n"
+    parts.extend(
+        f"{_QUEUE_STATUS_EMOJI.get(task['status'], '❓')} <code>{html.escape(task.get('title', '未知')[:25], quote=False)}</code> - {html.escape(task.get('artist', '')[:15], quote=False)}"
+        for task in tasks[-10:]
+    )
     
     if len(tasks) > 10:
-        msg += f"\n... 还有 {len(tasks) - 10} 个任务"
+        parts.append(f"\n... 还有 {len(tasks) - 10} 个任务")
     
-    await update.message.reply_text(msg, parse_mode='Markdown')
+    await update.message.reply_text("\n".join(parts), parse_mode='HTML')
 
 
+@admin_only
 async def cmd_download_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """查看下载历史 /dh"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     manager = get_download_manager()
     if not manager:
         await update.message.reply_text("📭 下载管理器未启用")
@@ -3418,22 +3533,14 @@ async def cmd_download_history(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("📭 暂无下载历史")
         return
     
-    msg = "📜 **最近下载历史**\n\n"
-    
-    status_emoji = {
-        'completed': '✅',
-        'failed': '❌',
-    }
+    parts = ["📜 <b>最近下载历史</b>", ""]
     
-    for item in history:
-        emoji = status_emoji.get(item['status'], '❓')
-        title = (item.get('title') or '未知')[:20]
-        artist = (item.get('artist') or '')[:12]
-        platform = item.get('platform', '?')
-        
-        msg += f"{emoji} `{title}` - {artist} [{platform}]\n"
+    parts.extend(
+        f"{_HISTORY_STATUS_EMOJI.get(item['status'], '❓')} <code>{html.escape((item.get('title') or '未知')[:20], quote=False)}</code> - {html.escape((item.get('artist') or '')[:12], quote=False)} [{html.escape(str(item.get('platform', '?')), quote=False)}]"
+        for item in history
+    )
     
-    await update.message.reply_text(msg, parse_mode='Markdown')
+    await update.message.reply_text("\n".join(parts), parse_mode='HTML')
 
 
 # ============================================================
@@ -3452,7 +3559,7 @@ async def check_expired_users_job(application):
         try:
             await asyncio.sleep(3600)  # 每小时检查一次
             
-            conn = sqlite3.connect(str(DATABASE_FILE), check_same_thread=False)
+            conn = connect_database(check_same_thread=False)
             cursor = conn.cursor()
             
             # 查找已过期但仍活跃的用户
@@ -3497,6 +3604,29 @@ async def check_expired_users_job(application):
             await asyncio.sleep(60)
 
 
+def _fetch_ranking_settings() -> dict:
+    """读取 bot_settings 中的 ranking_* 配置（同步阻塞，需经 asyncio.to_thread 调用）"""
+    conn = connect_database()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT key, value FROM bot_settings WHERE key LIKE 'ranking_%'")
+        return {key: value for key, value in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def _format_daily_song_block(index: int, song: dict) -> str:
+    """日榜 caption 中单首歌曲的文本块（以换行结尾，块之间留一个空行）"""
+    artist = song.get('artist', 'Unknown')
+    album = song.get('album', '')
+    return "".join((
+        f"{index}. {song.get('title', 'Unknown')}\n",
+        f"歌手: {artist}\n" if artist and artist != 'Unknown' else "",
+        f"专辑: {album}\n" if album else "",
+        f"播放次数: {song.get('count', 0)}\n",
+    ))
+
+
 async def daily_stats_job(application):
     """每日统计报告任务 - 基于数据库配置发送"""
     import datetime as dt
@@ -3504,7 +3634,6 @@ async def daily_stats_job(application):
     from bot.utils.database import get_database
     from bot.services.playback_stats import get_playback_stats
     from bot.utils.ranking_image import generate_daily_ranking_image
-    from io import BytesIO
     from bot.config import ADMIN_USER_ID
 
     logger.info("每日统计任务已启动")
@@ -3530,8 +3659,17 @@ async def daily_stats_job(application):
                 logger.info(f"触发每日统计推送: {daily_time_str}")
                 
                 # Fetch Data
+                # 统计数据与榜单配置互不依赖，并发读取
                 stats_svc = get_playback_stats()
-                data = stats_svc.get_global_daily_stats()
+                data, ranking_settings = await asyncio.gather(
+                    asyncio.to_thread(stats_svc.get_global_daily_stats),
+                    asyncio.to_thread(_fetch_ranking_settings),
+                    return_exceptions=True,
+                )
+                if isinstance(data, BaseException):
+                    raise data
+                if isinstance(ranking_settings, BaseException):
+                    ranking_settings = {}
                 
                 # Debug logging
                 logger.info(f"[DailyPush] Data received: leaderboard={len(data.get('leaderboard', []))}, top_songs={len(data.get('top_songs', []))}")
@@ -3547,48 +3685,23 @@ async def daily_stats_job(application):
                         if img_bytes:
                             # 生成完整歌曲列表 caption (和 /daily 命令一致)
                             from bot.config import DAILY_RANKING_SUBTITLE
-                            import sqlite3
-                            
-                            ranking_subtitle = DAILY_RANKING_SUBTITLE
-                            try:
-                                with sqlite3.connect(DATABASE_FILE) as conn:
-                                    cursor = conn.cursor()
-                                    cursor.execute("SELECT value FROM bot_settings WHERE key = 'ranking_daily_subtitle'")
-                                    row = cursor.fetchone()
-                                    if row and row[0]:
-                                        ranking_subtitle = row[0]
-                            except:
-                                pass
                             
-                            caption_lines = [
-                                f"【{ranking_subtitle} 播放日榜】\n",
-                                "▎热门歌曲：\n"
-                            ]
+                            ranking_subtitle = ranking_settings.get('ranking_daily_subtitle') or DAILY_RANKING_SUBTITLE
                             
                             top_songs = data.get('top_songs', [])[:10]
-                            for i, song in enumerate(top_songs):
-                                title = song.get('title', 'Unknown')
-                                artist = song.get('artist', 'Unknown')
-                                album = song.get('album', '')
-                                count = song.get('count', 0)
-                                
-                                caption_lines.append(f"{i+1}. {title}")
-                                if artist and artist != 'Unknown':
-                                    caption_lines.append(f"歌手: {artist}")
-                                if album:
-                                    caption_lines.append(f"专辑: {album}")
-                                caption_lines.append(f"播放次数: {count}")
-                                caption_lines.append("")
-                            
-                            caption_lines.append(f"\n#DayRanks  {data.get('date', '')}")
-                            caption = "\n".join(caption_lines)
+                            caption = "\n".join((
+                                f"【{ranking_subtitle} 播放日榜】\n",
+                                "▎热门歌曲：\n",
+                                *(_format_daily_song_block(i, song) for i, song in enumerate(top_songs, 1)),
+                                f"\n#DayRanks  {data.get('date', '')}",
+                            ))
                             
                             if len(caption) > 1024:
                                 caption = caption[:1020] + "..."
                             
                             await application.bot.send_photo(
                                 chat_id=int(target_id) if str(target_id).lstrip('-').isdigit() else target_id,
-                                photo=BytesIO(img_bytes),
+                                photo=img_bytes,
                                 caption=caption
                             )
                             logger.info(f"每日统计推送成功 -> {target_id}")
@@ -3633,7 +3746,6 @@ async def cookie_check_job(application):
             ncm_cookie = get_ncm_cookie()
             if ncm_cookie:
                 try:
-                    from bot.ncm_downloader import NeteaseMusicAPI
                     api = NeteaseMusicAPI(ncm_cookie)
                     logged_in, info = api.check_login()
                     if not logged_in:
@@ -3647,7 +3759,6 @@ async def cookie_check_job(application):
             qq_cookie = get_qq_cookie()
             if qq_cookie:
                 try:
-                    from bot.ncm_downloader import QQMusicAPI
                     api = QQMusicAPI(qq_cookie)
                     logged_in, info = api.check_login()
                     if not logged_in:
@@ -3709,7 +3820,6 @@ async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE
         # 搜索网易云
         ncm_cookie = get_ncm_cookie()
         if ncm_cookie:
-            from bot.ncm_downloader import NeteaseMusicAPI
             api = NeteaseMusicAPI(ncm_cookie)
             songs = api.search_songs(search_text, limit=5)
             
@@ -3736,7 +3846,6 @@ async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE
         # 搜索 QQ 音乐
         qq_cookie = get_qq_cookie()
         if qq_cookie:
-            from bot.ncm_downloader import QQMusicAPI
             api = QQMusicAPI(qq_cookie)
             songs = api.search_songs(search_text, limit=5)
             
@@ -3897,13 +4006,9 @@ async def cmd_syncinterval(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ 请输入有效的数字")
 
 
+@admin_only
 async def cmd_scaninterval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """设置 Emby 媒体库自动扫描间隔"""
-    user_id = str(update.effective_user.id)
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("无权执行此命令")
-        return
-    
     # 获取当前设置
     current_interval = EMBY_SCAN_INTERVAL
     try:
@@ -4012,7 +4117,6 @@ async def handle_sync_callback(update: Update, context: ContextTypes.DEFAULT_TYP
                 await query.message.reply_text("❌ 未配置网易云 Cookie")
                 return
             
-            from bot.ncm_downloader import MusicAutoDownloader
             ncm_settings = get_ncm_settings()
             download_quality = ncm_settings.get('ncm_quality', 'exhigh')
             download_dir = ncm_settings.get('download_dir', str(MUSIC_TARGET_DIR))
@@ -4149,7 +4253,6 @@ async def handle_sync_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             ncm_cookie = get_ncm_cookie()
             qq_cookie = get_qq_cookie()
             
-            from bot.ncm_downloader import MusicAutoDownloader
             ncm_settings = get_ncm_settings()
             download_quality = ncm_settings.get('ncm_quality', 'exhigh')
             download_dir = ncm_settings.get('download_dir', str(MUSIC_TARGET_DIR))
@@ -4276,10 +4379,10 @@ async def handle_sync_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             # 获取歌单歌曲列表
             if platform == 'netease':
                 p_id = extract_playlist_id(playlist_url, 'netease')
-                remote_name, songs = get_ncm_playlist_details(p_id)
+                remote_name, songs = await asyncio.to_thread(get_ncm_playlist_details, p_id)
             else:
                 p_id = extract_playlist_id(playlist_url, 'qq')
-                remote_name, songs = get_qq_playlist_details(p_id)
+                remote_name, songs = await asyncio.to_thread(get_qq_playlist_details, p_id)
             
             if not songs:
                 await query.edit_message_text("❌ 获取歌单内容失败")
@@ -4329,7 +4432,6 @@ async def handle_sync_callback(update: Update, context: ContextTypes.DEFAULT_TYP
                 await query.message.reply_text("❌ 未配置网易云 Cookie")
                 return
             
-            from bot.ncm_downloader import MusicAutoDownloader
             ncm_settings = get_ncm_settings()
             download_quality = ncm_settings.get('ncm_quality', 'exhigh')
             download_dir = ncm_settings.get('download_dir', str(MUSIC_TARGET_DIR))
@@ -4585,11 +4687,11 @@ async def cmd_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 获取歌单信息
     try:
         if platform == 'netease':
-            playlist_name, songs = get_ncm_playlist_details(playlist_id)
+            playlist_name, songs = await asyncio.to_thread(get_ncm_playlist_details, playlist_id)
         elif platform == 'spotify':
             playlist_name, songs = get_spotify_playlist_details(playlist_id)
         else:
-            playlist_name, songs = get_qq_playlist_details(playlist_id)
+            playlist_name, songs = await asyncio.to_thread(get_qq_playlist_details, playlist_id)
         song_count = len(songs) if songs else 0
     except Exception as e:
         logger.warning(f"获取歌单信息失败: {e}")
@@ -4772,10 +4874,10 @@ async def preview_playlist_request(query, context, request_id: int):
         # 获取歌单详情
         if platform == 'netease':
             playlist_id = extract_playlist_id(playlist_url, 'netease')
-            playlist_name, songs = get_ncm_playlist_details(playlist_id)
+            playlist_name, songs = await asyncio.to_thread(get_ncm_playlist_details, playlist_id)
         else:
             playlist_id = extract_playlist_id(playlist_url, 'qq')
-            playlist_name, songs = get_qq_playlist_details(playlist_id)
+            playlist_name, songs = await asyncio.to_thread(get_qq_playlist_details, playlist_id)
         
         if not songs:
             await query.message.reply_text("❌ 获取歌单内容失败")
@@ -4844,10 +4946,10 @@ async def process_playlist_request(query, context, request_id: int, action: str)
         # 获取歌单内容
         if platform == 'netease':
             playlist_id = extract_playlist_id(playlist_url, 'netease')
-            _, songs = get_ncm_playlist_details(playlist_id)
+            _, songs = await asyncio.to_thread(get_ncm_playlist_details, playlist_id)
         else:
             playlist_id = extract_playlist_id(playlist_url, 'qq')
-            _, songs = get_qq_playlist_details(playlist_id)
+            _, songs = await asyncio.to_thread(get_qq_playlist_details, playlist_id)
         
         if not songs:
             await query.message.reply_text("❌ 获取歌单内容失败")
@@ -4917,7 +5019,6 @@ async def process_playlist_request(query, context, request_id: int, action: str)
             await query.message.reply_text("❌ 未配置网易云 Cookie")
             return
         
-        from bot.ncm_downloader import MusicAutoDownloader
         ncm_settings = get_ncm_settings()
         download_quality = ncm_settings.get('ncm_quality', 'exhigh')
         download_dir = ncm_settings.get('download_dir', str(MUSIC_TARGET_DIR))
@@ -5054,7 +5155,6 @@ async def handle_preview_callback(update: Update, context: ContextTypes.DEFAULT_
         song = search_results[idx]
         song_id = song['source_id']
         
-        from bot.ncm_downloader import NeteaseMusicAPI
         api = NeteaseMusicAPI(ncm_cookie)
         
         # 获取歌曲URL（使用标准音质以加快速度）
@@ -5112,7 +5212,6 @@ async def handle_qq_preview_callback(update: Update, context: ContextTypes.DEFAU
         song = search_results[idx]
         song_mid = song['source_id']
         
-        from bot.ncm_downloader import QQMusicAPI
         api = QQMusicAPI(qq_cookie)
         
         # 获取歌曲URL（使用标准音质）
@@ -5164,8 +5263,6 @@ async def handle_search_download_callback(update: Update, context: ContextTypes.
         return
     
     try:
-        from bot.ncm_downloader import MusicAutoDownloader, NeteaseMusicAPI
-        
         # 获取下载设置
         ncm_settings = get_ncm_settings()
         download_quality = ncm_settings.get('ncm_quality', 'exhigh')
@@ -5413,8 +5510,6 @@ async def handle_qq_download_callback(update: Update, context: ContextTypes.DEFA
         return
     
     try:
-        from bot.ncm_downloader import QQMusicAPI
-        
         # 获取下载设置
         ncm_settings = get_ncm_settings()
         # QQ下载使用 qq_quality
@@ -5732,7 +5827,6 @@ async def handle_retry_callback(update: Update, context: ContextTypes.DEFAULT_TY
         # 直接执行下载逻辑
         # 读取下载配置
         from bot.config import QQ_COOKIE
-        from bot.ncm_downloader import QQMusicAPI
         
         qq_cookie = context.bot_data.get('qq_cookie') or QQ_COOKIE
         ncm_settings = context.bot_data.get('ncm_settings', {})
@@ -5870,7 +5964,7 @@ async def start_file_organizer_if_enabled(application):
                     parse_mode='Markdown'
                 )
             except Exception as e:
-                logger.debug(f"发送整理器启动通知失败: {e}")
+                logger.debug("发送整理器启动通知失败: %s", e)
         
     except Exception as e:
         logger.error(f"启动文件整理器失败: {e}")
@@ -5894,7 +5988,7 @@ async def refresh_qq_cookie_task(application):
             await asyncio.sleep(60)  # 等待应用完全启动
             
             # 从数据库读取当前 Cookie
-            conn = sqlite3.connect(str(DATABASE_FILE))
+            conn = connect_database()
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -5904,7 +5998,6 @@ async def refresh_qq_cookie_task(application):
             
             if current_cookie:
                 logger.info("正在尝试刷新 QQ 音乐 Cookie...")
-                from bot.ncm_downloader import QQMusicAPI
                 api = QQMusicAPI(current_cookie)
                 
                 # 双重检查：先尝试刷新，如果刷新失败，再去通过 check_login 确认是否真失效
@@ -5974,7 +6067,7 @@ async def check_ncm_cookie_task(application):
         try:
             await asyncio.sleep(80)  # 错开 80 秒，避免和其他进程同时启动抢资源
             
-            conn = sqlite3.connect(str(DATABASE_FILE))
+            conn = connect_database()
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -5984,7 +6077,6 @@ async def check_ncm_cookie_task(application):
             conn.close()
             
             if current_cookie:
-                from bot.ncm_downloader import NeteaseMusicAPI
                 api = NeteaseMusicAPI(current_cookie)
                 
                 logger.info("正在验证网易云音乐 Cookie 状态...")
@@ -6031,7 +6123,7 @@ async def radar_push_job(application):
             current_time = now.strftime('%H:%M')
             
             # 读取配置
-            conn = sqlite3.connect(str(DATABASE_FILE))
+            conn = connect_database()
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -6162,7 +6254,6 @@ async def scheduled_ranking_job(application):
     """定时发送排行榜到指定群组/频道"""
     import os
     from datetime import datetime, time as dtime
-    from io import BytesIO
     
     logger.info("启动定时排行榜任务...")
     
@@ -6175,15 +6266,8 @@ async def scheduled_ranking_job(application):
             weekday = now.weekday()  # 0=周一, 6=周日
             day = now.day
             
-            # 从数据库读取配置
-            conn = sqlite3.connect(str(DATABASE_FILE))
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # 获取设置
-            cursor.execute("SELECT key, value FROM bot_settings WHERE key LIKE 'ranking_%'")
-            settings = {row['key']: row['value'] for row in cursor.fetchall()}
-            conn.close()
+            # 从数据库读取配置（放到线程中，避免每分钟阻塞事件循环）
+            settings = await asyncio.to_thread(_fetch_ranking_settings)
             
             target_chat = settings.get('ranking_target_chat', '')
             if not target_chat:
@@ -6262,7 +6346,7 @@ async def scheduled_ranking_job(application):
 
                             await application.bot.send_photo(
                                 chat_id=target_chat, 
-                                photo=BytesIO(img), 
+                                photo=img, 
                                 caption=caption
                             )
                         else:
@@ -6326,7 +6410,7 @@ async def scheduled_ranking_job(application):
                             if len(caption) > 1024:
                                 caption = caption[:1020] + "..."
 
-                            await application.bot.send_photo(chat_id=target_chat, photo=BytesIO(img), caption=caption)
+                            await application.bot.send_photo(chat_id=target_chat, photo=img, caption=caption)
                             logger.info("已发送周榜")
                         else:
                             logger.error("生成周榜图片失败")
@@ -6342,7 +6426,7 @@ async def scheduled_ranking_job(application):
                     last_month = (now.replace(day=1) - timedelta(days=1)).strftime('%Y年%m月')
                     img = generate_ranking_image(ranking, "🏆 每月播放榜", last_month, emby_base_url=emby_url)
                     if img:
-                        await application.bot.send_photo(chat_id=target_chat, photo=BytesIO(img),
+                        await application.bot.send_photo(chat_id=target_chat, photo=img,
                                                         caption=f"🏆 每月播放榜 ({last_month})")
                     logger.info("已发送月榜")
                     
@@ -6399,7 +6483,7 @@ async def scheduled_emby_scan_job(application):
             # 扫描并更新缓存
             if emby_auth.get('access_token') and emby_auth.get('user_id'):
                 # 这是一个同步函数，直接调用
-                scan_emby_library()
+                await asyncio.to_thread(scan_emby_library)
                 logger.info("Emby 媒体库扫描完成")
             
         except Exception as e:
@@ -6432,7 +6516,6 @@ async def process_batch_download(songs_to_download, download_quality, user_id, u
     ncm_cookie = get_ncm_cookie()
     qq_cookie = get_qq_cookie()
     
-    from bot.ncm_downloader import MusicAutoDownloader
     downloader = MusicAutoDownloader(
         ncm_cookie, qq_cookie, str(download_path),
         proxy_url=MUSIC_PROXY_URL, proxy_key=MUSIC_PROXY_KEY
@@ -6643,11 +6726,11 @@ async def handle_playlist_action_callback(update: Update, context: ContextTypes.
             name = "未知歌单"
             if platform == 'netease':
                 logger.info(f"[订阅] 获取网易云歌单详情...")
-                name, songs = get_ncm_playlist_details(playlist_id)
+                name, songs = await asyncio.to_thread(get_ncm_playlist_details, playlist_id)
                 playlist_url = f"https://music.163.com/playlist?id={playlist_id}"
             elif platform == 'qq':
                 logger.info(f"[订阅] 获取QQ音乐歌单详情...")
-                name, songs = get_qq_playlist_details(playlist_id)
+                name, songs = await asyncio.to_thread(get_qq_playlist_details, playlist_id)
                 playlist_url = f"https://y.qq.com/n/ryqq/playlist/{playlist_id}"
             else:
                 await query.edit_message_text("❌ 暂不支持该平台")
@@ -6878,7 +6961,6 @@ async def handle_fix_metadata_callback(update: Update, context: ContextTypes.DEF
         keyword = data.replace("fix_search_qq_", "")
         await query.edit_message_text(f"🔍 正在 QQ 音乐搜索 `{keyword}`...", parse_mode='Markdown')
         
-        from bot.ncm_downloader import MusicAutoDownloader
         settings = get_ncm_settings()
         downloader = MusicAutoDownloader(
             ncm_cookie=settings['cookie'], 
@@ -6920,7 +7002,6 @@ async def handle_fix_metadata_callback(update: Update, context: ContextTypes.DEF
         await query.edit_message_text("⏳ 正在下载封面并写入元数据...\n(QQ 源可能需要较长时间获取详情)")
         
         # 初始化下载器
-        from bot.ncm_downloader import MusicAutoDownloader
         settings = get_ncm_settings()
         downloader = MusicAutoDownloader(
             ncm_cookie=settings['cookie'], 
@@ -6965,7 +7046,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"🔍 正在网易云搜索 `{keyword}`...", parse_mode='Markdown')
         
         # 初始化下载器用于搜索
-        from bot.ncm_downloader import MusicAutoDownloader
         settings = get_ncm_settings()
         downloader = MusicAutoDownloader(
             ncm_cookie=settings['cookie'], 
@@ -7015,7 +7095,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ncm_cookie = get_ncm_cookie()
             if ncm_cookie:
                 try:
-                    name, songs = get_ncm_playlist_details(playlist_id)
+                    name, songs = await asyncio.to_thread(get_ncm_playlist_details, playlist_id)
                     if name:
                         msg = f"🎵 **发现网易云歌单**\n\n"
                         msg += f"📜 **名称**: {name}\n"
@@ -7034,7 +7114,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     logger.error(f"解析歌单失败: {e}")
         elif playlist_type == 'qq':
             try:
-                name, songs = get_qq_playlist_details(playlist_id)
+                name, songs = await asyncio.to_thread(get_qq_playlist_details, playlist_id)
                 if name:
                     msg = f"🎵 **发现QQ音乐歌单**\n\n"
                     msg += f"📜 **名称**: {name}\n"
@@ -7112,7 +7192,7 @@ async def emby_webhook_notify_job(application):
                             )
                             
                     except Exception as e:
-                        logger.debug(f"发送 Webhook 通知失败: {e}")
+                        logger.debug("发送 Webhook 通知失败: %s", e)
             
         except Exception as e:
             logger.error(f"Webhook 通知任务出错: {e}")
@@ -7498,8 +7578,7 @@ def main():
     global database_conn
     import sqlite3
     from bot.config import DATABASE_FILE
-    database_conn = sqlite3.connect(str(DATABASE_FILE), check_same_thread=False, timeout=15)
-    database_conn.execute("PRAGMA journal_mode=WAL")
+    database_conn = connect_database(check_same_thread=False, timeout=15)
     database_conn.row_factory = sqlite3.Row
     
     # 调用完整的数据库初始化函数
@@ -7,6 +7,7 @@ import json
 import sqlite3
 import secrets
 import hashlib
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, List
@@ -65,6 +66,38 @@ def get_db():
 print(f"[Web] Using Database at: {DATABASE_FILE.absolute()}")
 
 
+# 共享 HTTP 会话：封面代理/元数据搜索复用连接池，避免每次请求重新 TCP+TLS 握手
+_http_session = None
+
+def get_http_session():
+    """获取共享的 requests.Session（首次调用时创建）"""
+    global _http_session
+    if _http_session is None:
+        import requests
+        import http.cookiejar
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        # 只复用连接不保存 Cookie：封面代理会请求任意外部地址，不能把对方的 Set-Cookie 带到后续请求
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_session = session
+    return _http_session
+
+
+# 共享 Telegram Bot API 客户端：通知/榜单推送复用连接，应用关闭时在 lifespan 中释放
+_telegram_client = None
+
+def get_telegram_client():
+    """获取共享的 httpx.AsyncClient（首次调用时创建）"""
+    global _telegram_client
+    if _telegram_client is None or _telegram_client.is_closed:
+        import httpx
+        _telegram_client = httpx.AsyncClient()
+    return _telegram_client
+
+
 def get_ncm_cookie():
     """获取网易云 Cookie（优先从数据库读取）"""
     try:
@@ -235,7 +268,6 @@ async def send_telegram_notification(item_type: str, title: str, artist: str, al
     """直接发送 Telegram 入库通知"""
     import os
     import logging
-    import httpx
     logger = logging.getLogger(__name__)
     
     bot_token = os.environ.get('TELEGRAM_BOT_TOKEN') or os.environ.get('TELEGRAM_TOKEN')
@@ -250,8 +282,8 @@ async def send_telegram_notification(item_type: str, title: str, artist: str, al
         return False
     
     # 检查是否启用通知
-    webhook_notify = os.environ.get('EMBY_WEBHOOK_NOTIFY', 'true').lower() == 'true'
-    if not webhook_notify:
+    from bot.config import CONFIG
+    if not CONFIG.emby_webhook_notify:
         print("[Webhook] Webhook 通知已禁用")
         return False
     
@@ -304,19 +336,18 @@ async def send_telegram_notification(item_type: str, title: str, artist: str, al
         
         # 使用 HTTP API 直接发送消息
         url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json={
-                "chat_id": admin_id,
-                "text": msg,
-                "parse_mode": "Markdown"
-            })
-            
-            if resp.status_code == 200:
-                print(f"[Webhook] ✓ 已发送通知: {title} - {artist} [{audio_format}]")
-                return True
-            else:
-                print(f"[Webhook] ✗ 发送失败: {resp.text}")
-                return False
+        resp = await get_telegram_client().post(url, json={
+            "chat_id": admin_id,
+            "text": msg,
+            "parse_mode": "Markdown"
+        })
+        
+        if resp.status_code == 200:
+            print(f"[Webhook] ✓ 已发送通知: {title} - {artist} [{audio_format}]")
+            return True
+        else:
+            print(f"[Webhook] ✗ 发送失败: {resp.text}")
+            return False
         
     except Exception as e:
         print(f"[Webhook] ✗ 发送异常: {e}")
@@ -463,6 +494,9 @@ async def lifespan(app: FastAPI):
         stop_watcher()
     except:
         pass
+    
+    if _telegram_client is not None:
+        await _telegram_client.aclose()
 
 
 app = FastAPI(
@@ -1250,6 +1284,7 @@ def safe_int(v, default=0):
 @app.get("/api/config")
 async def get_config():
     """获取配置信息 (恢复 v1.12.9 完整字段 + safe_int 改进)"""
+    from bot.config import CONFIG
     ncm_cookie = os.environ.get('NCM_COOKIE', '')
     qq_cookie = os.environ.get('QQ_COOKIE', '')
     
@@ -1288,7 +1323,7 @@ async def get_config():
         
         cursor.execute('SELECT value FROM bot_settings WHERE key = ?', ('auto_download',))
         row = cursor.fetchone()
-        auto_download = row['value'] == 'true' if row else os.environ.get('AUTO_DOWNLOAD', 'false').lower() == 'true'
+        auto_download = row['value'] == 'true' if row else CONFIG.auto_download
         
         cursor.execute('SELECT value FROM bot_settings WHERE key = ?', ('auto_organize',))
         row = cursor.fetchone()
@@ -1329,7 +1364,7 @@ async def get_config():
         traceback.print_exc()
         ncm_quality = os.environ.get('NCM_QUALITY', 'exhigh')
         qq_quality = '320'
-        auto_download = os.environ.get('AUTO_DOWNLOAD', 'false').lower() == 'true'
+        auto_download = CONFIG.auto_download
         auto_organize = False
         download_dir = str(MUSIC_TARGET_DIR)
         organize_dir = ''
@@ -2512,7 +2547,7 @@ async def check_pending_playlist_match(song_name: str, artist: str):
         # 目前只记录日志，实际通知通过 Telegram Bot 完成
         import logging
         logger = logging.getLogger(__name__)
-        logger.debug(f"检查歌曲 '{song_name}' 是否匹配 {len(playlists)} 个订阅歌单")
+        logger.debug("检查歌曲 '%s' 是否匹配 %d 个订阅歌单", song_name, len(playlists))
         
         conn.close()
         
@@ -2581,12 +2616,66 @@ async def test_webhook_notification(user: dict = Depends(require_login)):
         return {"success": False, "message": str(e)}
 
 
+# 进行中的日榜计算 {日期: Future}，同一天的并发请求共享一次统计与绘图
+_daily_inflight = {}
+
+# 榜单图片缓存 {(日期/周范围, 标题, 数据指纹): (生成时间, PNG bytes)}
+_ranking_image_cache = {}
+_ranking_image_cache_lock = threading.Lock()  # 日榜/周榜在不同工作线程中渲染
+_RANKING_IMAGE_TTL = 300  # 5分钟
+
+
+def _render_ranking_image(data, stats_svc, title=None):
+    """生成榜单图片，同一标题、榜单数据未变时在 TTL 内直接复用已渲染的结果"""
+    from bot.utils.ranking_image import generate_daily_ranking_image
+    
+    # 数据指纹：播放数据变化后重新渲染，保证图片与按同一份 data 生成的文案一致
+    digest = hashlib.md5(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+    key = (data.get('date') or data.get('week_range', ''), title, digest)
+    now = _time_module.time()
+    with _ranking_image_cache_lock:
+        cached = _ranking_image_cache.get(key)
+    if cached and now - cached[0] < _RANKING_IMAGE_TTL:
+        return cached[1]
+    
+    kwargs = {'title': title} if title else {}
+    img_bytes = generate_daily_ranking_image(data, emby_url=stats_svc.emby_url, emby_token=stats_svc.emby_token, **kwargs)
+    if img_bytes:
+        with _ranking_image_cache_lock:
+            # 过期条目顺便清理，避免跨天累积
+            for k in [k for k, (ts, _) in _ranking_image_cache.items() if now - ts >= _RANKING_IMAGE_TTL]:
+                del _ranking_image_cache[k]
+            _ranking_image_cache[key] = (now, img_bytes)
+    return img_bytes
+
+
+async def _compute_daily_ranking(stats_svc):
+    """获取日榜数据并生成图片，返回 (data, img_bytes)"""
+    key = datetime.now().strftime('%Y-%m-%d')
+    future = _daily_inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+    
+    def build():
+        data = stats_svc.get_global_daily_stats()
+        img_bytes = None
+        if data and data.get('leaderboard'):
+            img_bytes = _render_ranking_image(data, stats_svc)
+        return data, img_bytes
+    
+    future = asyncio.get_running_loop().run_in_executor(None, build)
+    _daily_inflight[key] = future
+    try:
+        return await asyncio.shield(future)
+    finally:
+        _daily_inflight.pop(key, None)
+
+
 @app.post("/api/ranking/test/daily")
 async def test_daily_ranking_push(user: dict = Depends(require_login)):
     """测试日榜推送"""
     try:
         from bot.services.playback_stats import get_playback_stats
-        from bot.utils.ranking_image import generate_daily_ranking_image
         import sqlite3
         
         # 获取推送目标 - 优先从数据库读取，其次从环境变量
@@ -2609,16 +2698,13 @@ async def test_daily_ranking_push(user: dict = Depends(require_login)):
         
         # 获取统计数据
         stats_svc = get_playback_stats()
-        data = stats_svc.get_global_daily_stats()
+        data, img_bytes = await _compute_daily_ranking(stats_svc)
         
         print(f"[TestDailyPush] Data: leaderboard={len(data.get('leaderboard', []))}, top_songs={len(data.get('top_songs', []))}")
         
         if not data or not data.get('leaderboard'):
             return {"success": False, "message": f"没有播放数据。请检查 Emby Playback Reporting 插件是否正常工作。"}
         
-        # 生成图片
-        img_bytes = generate_daily_ranking_image(data, emby_url=stats_svc.emby_url, emby_token=stats_svc.emby_token)
-        
         if not img_bytes:
             return {"success": False, "message": "生成图片失败"}
         
@@ -2650,19 +2736,17 @@ async def test_daily_ranking_push(user: dict = Depends(require_login)):
         
         # 发送到 Telegram
         from bot.config import TELEGRAM_TOKEN as TELEGRAM_BOT_TOKEN
-        import httpx
         
-        async with httpx.AsyncClient() as client:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-            files = {'photo': ('daily_ranking.png', img_bytes, 'image/png')}
-            form_data = {'chat_id': target_chat_id, 'caption': caption[:1024]}
-            resp = await client.post(url, files=files, data=form_data, timeout=30)
-            result = resp.json()
-            
-            if result.get('ok'):
-                return {"success": True, "message": f"日榜已推送到 {target_chat_id}"}
-            else:
-                return {"success": False, "message": f"Telegram API 错误: {result.get('description', 'Unknown error')}"}
+        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
+        files = {'photo': ('daily_ranking.png', img_bytes, 'image/png')}
+        form_data = {'chat_id': target_chat_id, 'caption': caption[:1024]}
+        resp = await get_telegram_client().post(url, files=files, data=form_data, timeout=30)
+        result = resp.json()
+        
+        if result.get('ok'):
+            return {"success": True, "message": f"日榜已推送到 {target_chat_id}"}
+        else:
+            return {"success": False, "message": f"Telegram API 错误: {result.get('description', 'Unknown error')}"}
                 
     except Exception as e:
         print(f"[TestDailyPush] 失败: {e}")
@@ -2676,7 +2760,6 @@ async def test_weekly_ranking_push(user: dict = Depends(require_login)):
     """测试周榜推送"""
     try:
         from bot.services.playback_stats import get_playback_stats
-        from bot.utils.ranking_image import generate_daily_ranking_image
         import sqlite3
         
         # 获取推送目标 - 优先从数据库读取，其次从环境变量
@@ -2705,7 +2788,7 @@ async def test_weekly_ranking_push(user: dict = Depends(require_login)):
             return {"success": False, "message": "没有播放数据"}
         
         # 生成图片 - 复用日榜图片生成器，传入周榜标题
-        img_bytes = generate_daily_ranking_image(data, emby_url=stats_svc.emby_url, emby_token=stats_svc.emby_token, title="Weekly Music Charts")
+        img_bytes = await asyncio.to_thread(_render_ranking_image, data, stats_svc, "Weekly Music Charts")
         
         if not img_bytes:
             return {"success": False, "message": "生成图片失败"}
@@ -2738,19 +2821,17 @@ async def test_weekly_ranking_push(user: dict = Depends(require_login)):
         
         # 发送到 Telegram
         from bot.config import TELEGRAM_TOKEN as TELEGRAM_BOT_TOKEN
-        import httpx
         
-        async with httpx.AsyncClient() as client:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-            files = {'photo': ('weekly_ranking.png', img_bytes, 'image/png')}
-            form_data = {'chat_id': target_chat_id, 'caption': caption[:1024]}
-            resp = await client.post(url, files=files, data=form_data, timeout=30)
-            result = resp.json()
-            
-            if result.get('ok'):
-                return {"success": True, "message": f"周榜已推送到 {target_chat_id}"}
-            else:
-                return {"success": False, "message": f"Telegram API 错误: {result.get('description', 'Unknown error')}"}
+        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
+        files = {'photo': ('weekly_ranking.png', img_bytes, 'image/png')}
+        form_data = {'chat_id': target_chat_id, 'caption': caption[:1024]}
+        resp = await get_telegram_client().post(url, files=files, data=form_data, timeout=30)
+        result = resp.json()
+        
+        if result.get('ok'):
+            return {"success": True, "message": f"周榜已推送到 {target_chat_id}"}
+        else:
+            return {"success": False, "message": f"Telegram API 错误: {result.get('description', 'Unknown error')}"}
                 
     except Exception as e:
         print(f"[TestWeeklyPush] 失败: {e}")
@@ -3356,7 +3437,9 @@ async def metadata_detail(path: str = Query(...)):
         return JSONResponse({"error": "文件不存在"})
     
     try:
-        audio = File(str(file_path))
+        # 显式 64KB 缓冲：NAS/NFS 上读取标签头时避免大量小块 read
+        with open(file_path, 'rb', buffering=65536) as fh:
+            audio = File(fh)
         if audio is None:
             return JSONResponse({"error": "无法读取音频文件"})
         
@@ -3450,7 +3533,6 @@ async def metadata_detail(path: str = Query(...)):
 @app.post("/api/metadata/search")
 async def metadata_search(request: Request):
     """在线搜索元数据（返回多个候选结果）"""
-    import requests
     import urllib.parse
     
     data = await request.json()
@@ -3461,11 +3543,11 @@ async def metadata_search(request: Request):
     if not query:
         return JSONResponse({"results": [], "error": "请输入搜索关键词"})
     
-    results = []
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
     
     # 网易云音乐搜索
-    if source in ["auto", "netease"]:
+    def search_netease():
+        results = []
         try:
             # Get Cookie
             conn = get_db()
@@ -3532,9 +3614,12 @@ async def metadata_search(request: Request):
                     })
         except Exception as e:
             print(f"[MetadataSearch] 网易云搜索失败: {e}")
+        
+        return results
     
     # QQ 音乐搜索
-    if source in ["auto", "qq"]:
+    def search_qq():
+        results = []
         try:
             qq_url = "https://c.y.qq.com/soso/fcgi-bin/client_search_cp"
             params = {
@@ -3544,7 +3629,7 @@ async def metadata_search(request: Request):
                 'n': 10,
                 't': 0 if search_type == "song" else 8
             }
-            resp = requests.get(qq_url, params=params, headers={**headers, 'Referer': 'https://y.qq.com'}, timeout=10)
+            resp = get_http_session().get(qq_url, params=params, headers={**headers, 'Referer': 'https://y.qq.com'}, timeout=10)
             if resp.status_code == 200:
                 data = resp.json()
                 if search_type == "song":
@@ -3589,6 +3674,19 @@ async def metadata_search(request: Request):
                         })
         except Exception as e:
             print(f"[MetadataSearch] QQ音乐搜索失败: {e}")
+        
+        return results
+    
+    # 两个来源互不依赖，在线程中并发查询，耗时取决于较慢的一方
+    searches = []
+    if source in ["auto", "netease"]:
+        searches.append(asyncio.to_thread(search_netease))
+    if source in ["auto", "qq"]:
+        searches.append(asyncio.to_thread(search_qq))
+    
+    results = []
+    for source_results in await asyncio.gather(*searches):
+        results.extend(source_results)
     
     return JSONResponse({"results": results})
 
@@ -3602,7 +3700,6 @@ async def metadata_update(request: Request):
     from mutagen.flac import FLAC
     from mutagen.mp4 import MP4
     from mutagen.id3 import ID3, TIT2, TPE1, TALB, TPE2, TDRC, TRCK, TCON, APIC
-    import requests
     import base64
     
     data = await request.json()
@@ -3623,7 +3720,7 @@ async def metadata_update(request: Request):
         cover_data = None
         if cover_url:
             try:
-                resp = requests.get(cover_url, timeout=15)
+                resp = get_http_session().get(cover_url, timeout=15)
                 if resp.status_code == 200 and len(resp.content) > 1000:
                     cover_data = resp.content
             except:
@@ -3934,7 +4031,6 @@ async def api_apply_metadata(req: FixMetadataRequest):
 @app.get("/api/proxy/cover")
 async def api_proxy_cover(url: str = Query(...)):
     """代理获取封面图片，解决 Referer 和 Mixed Content 问题"""
-    import requests
     from fastapi import Response
     
     if not url:
@@ -3957,7 +4053,7 @@ async def api_proxy_cover(url: str = Query(...)):
         # 使用 verify=False 忽略 SSL 问题 (部分 CDN 证书可能有问题)
         # run in threadpool to avoid blocking async loop
         def fetch():
-            return requests.get(url, headers=headers, timeout=15, verify=False)
+            return get_http_session().get(url, headers=headers, timeout=15, verify=False)
             
         r = await asyncio.to_thread(fetch)
         
@@ -4079,17 +4175,20 @@ async def api_organize_current_dir(req: OrganizeRequest):
         if success_count > 0:
             try:
                 deleted_dirs = 0
-                # 从最深的子目录开始删除空目录
-                for dirpath in sorted(source_path.rglob('*'), key=lambda p: len(str(p)), reverse=True):
-                    if dirpath.is_dir():
-                        try:
-                            # 检查目录是否为空（忽略隐藏文件）
-                            contents = [f for f in dirpath.iterdir() if not f.name.startswith('.')]
-                            if not contents:
-                                dirpath.rmdir()
-                                deleted_dirs += 1
-                        except OSError:
-                            pass  # 目录不为空或无权限
+                source_root = str(source_path)
+                # 自底向上遍历，子目录总是先于父目录处理，无需按路径长度排序
+                for dirpath, _, _ in os.walk(source_root, topdown=False):
+                    if dirpath == source_root:
+                        continue
+                    try:
+                        # 检查目录是否为空（忽略隐藏文件），遇到第一个可见项即停止
+                        with os.scandir(dirpath) as it:
+                            has_visible = any(not entry.name.startswith('.') for entry in it)
+                        if not has_visible:
+                            os.rmdir(dirpath)
+                            deleted_dirs += 1
+                    except OSError:
+                        pass  # 目录不为空或无权限
                 if deleted_dirs > 0:
                     logger.info(f"已清理 {deleted_dirs} 个空文件夹")
             except Exception as cleanup_err: